@@ -6,6 +6,7 @@ import subprocess
 import re
 from pydub import AudioSegment
 import tempfile
+import wave
 from pydub import AudioSegment
 import os
 import nltk
@@ -58,11 +59,27 @@ def wipe_folder(folder_path):
 # wipe_folder(folder_to_wipe)
 
 
+# Compiled once, used as sort keys over every chapter file name
+chapter_number_pattern = re.compile(r'\d+')
+chapter_file_pattern = re.compile(r'chapter_(\d+)\.txt')
+
+# Concatenate WAV files with the ffmpeg concat demuxer, no re-encode and no
+# growing in-memory AudioSegment copied on every append
+def concat_wav_files(input_file_paths, output_file_path):
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as list_file:
+        for input_file_path in input_file_paths:
+            escaped_path = os.path.abspath(input_file_path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped_path}'\n")
+    try:
+        subprocess.run(['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_file.name, '-c', 'copy', output_file_path], check=True)
+    finally:
+        os.remove(list_file.name)
+
 def create_m4b_from_chapters(input_dir, ebook_file, output_dir):
     # Function to sort chapters based on their numeric order
     def sort_key(chapter_file):
-        numbers = re.findall(r'\d+', chapter_file)
-        return int(numbers[0]) if numbers else 0
+        match = chapter_number_pattern.search(chapter_file)
+        return int(match.group()) if match else 0
 
     # Extract metadata and cover image from the eBook file
     def extract_metadata_and_cover(ebook_path):
@@ -76,15 +93,7 @@ def create_m4b_from_chapters(input_dir, ebook_file, output_dir):
         return None
     # Combine WAV files into a single file
     def combine_wav_files(chapter_files, output_path):
-    	# Initialize an empty audio segment
-    	combined_audio = AudioSegment.empty()
-
-    	# Sequentially append each file to the combined_audio
-    	for chapter_file in chapter_files:
-    		audio_segment = AudioSegment.from_wav(chapter_file)
-    		combined_audio += audio_segment
-    	# Export the combined audio to the output file path
-    	combined_audio.export(output_path, format='wav')
+    	concat_wav_files(chapter_files, output_path)
     	print(f"Combined audio saved to {output_path}")
 
     # Function to generate metadata for M4B chapters
@@ -93,7 +102,9 @@ def create_m4b_from_chapters(input_dir, ebook_file, output_dir):
             file.write(';FFMETADATA1\n')
             start_time = 0
             for index, chapter_file in enumerate(chapter_files):
-                duration_ms = len(AudioSegment.from_wav(chapter_file))
+                # Duration from the WAV header, same rounding as len(AudioSegment) without decoding the file
+                with wave.open(chapter_file, 'rb') as wav_file:
+                    duration_ms = round(1000 * wav_file.getnframes() / wav_file.getframerate())
                 file.write(f'[CHAPTER]\nTIMEBASE=1/1000\nSTART={start_time}\n')
                 file.write(f'END={start_time + duration_ms}\ntitle=Chapter {index + 1}\n')
                 start_time += duration_ms
@@ -190,8 +201,8 @@ def create_chapter_labeled_book(ebook_file_path):
         # Iterate through the items in the EPUB file
         for item in book.get_items():
             if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                # Use BeautifulSoup to parse HTML content
-                soup = BeautifulSoup(item.get_content(), 'html.parser')
+                # Use BeautifulSoup to parse HTML content, lxml (C parser, installed with ebooklib) is much faster than html.parser
+                soup = BeautifulSoup(item.get_content(), 'lxml')
                 text = soup.get_text()
 
                 # Check if the text is not empty
@@ -226,31 +237,35 @@ def create_chapter_labeled_book(ebook_file_path):
     nltk.download('punkt')
 
     def process_chapter_files(folder_path, output_csv):
-        with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
+        # Same english punkt model sent_tokenize uses, span_tokenize also gives each sentence offsets
+        sentence_tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
+        with open(output_csv, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
             writer = csv.writer(csvfile)
             # Write the header row
             writer.writerow(['Text', 'Start Location', 'End Location', 'Is Quote', 'Speaker', 'Chapter'])
 
             # Process each chapter file
-            chapter_files = sorted(os.listdir(folder_path), key=lambda x: int(x.split('_')[1].split('.')[0]))
-            for filename in chapter_files:
-                if filename.startswith('chapter_') and filename.endswith('.txt'):
-                    chapter_number = int(filename.split('_')[1].split('.')[0])
-                    file_path = os.path.join(folder_path, filename)
-
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as file:
-                            text = file.read()
-                            # Insert "NEWCHAPTERABC" at the beginning of each chapter's text
-                            if text:
-                                text = "NEWCHAPTERABC" + text
-                            sentences = nltk.tokenize.sent_tokenize(text)
-                            for sentence in sentences:
-                                start_location = text.find(sentence)
-                                end_location = start_location + len(sentence)
-                                writer.writerow([sentence, start_location, end_location, 'True', 'Narrator', chapter_number])
-                    except Exception as e:
-                        print(f"Error processing file {filename}: {e}")
+            # Parse each chapter number once and sort on it
+            chapter_files = sorted(
+                (int(match.group(1)), filename) for filename in os.listdir(folder_path)
+                if filename.startswith('chapter_') and filename.endswith('.txt') and (match := chapter_file_pattern.match(filename))
+            )
+            for chapter_number, filename in chapter_files:
+                file_path = os.path.join(folder_path, filename)
+
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as file:
+                        text = file.read()
+                        # Insert "NEWCHAPTERABC" at the beginning of each chapter's text
+                        if text:
+                            text = "NEWCHAPTERABC" + text
+                        # One writerows call per chapter instead of one writerow per sentence
+                        writer.writerows(
+                            [text[start_location:end_location], start_location, end_location, 'True', 'Narrator', chapter_number]
+                            for start_location, end_location in sentence_tokenizer.span_tokenize(text)
+                        )
+                except Exception as e:
+                    print(f"Error processing file {filename}: {e}")
 
     # Example usage
     folder_path = os.path.join(".", "Working_files", "temp_ebook")
@@ -260,7 +275,7 @@ def create_chapter_labeled_book(ebook_file_path):
 
     def sort_key(filename):
         """Extract chapter number for sorting."""
-        match = re.search(r'chapter_(\d+)\.txt', filename)
+        match = chapter_file_pattern.search(filename)
         return int(match.group(1)) if match else 0
 
     def combine_chapters(input_folder, output_file):
@@ -311,6 +326,7 @@ def calibre_installed():
 
 
 import os
+import numpy as np
 import torch
 from TTS.api import TTS
 from nltk.tokenize import sent_tokenize
@@ -321,32 +337,6 @@ default_target_voice_path = "default_voice.wav"  # Ensure this is a valid path
 default_language_code = "en"
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def combine_wav_files(input_directory, output_directory, file_name):
-    # Ensure that the output directory exists, create it if necessary
-    os.makedirs(output_directory, exist_ok=True)
-
-    # Specify the output file path
-    output_file_path = os.path.join(output_directory, file_name)
-
-    # Initialize an empty audio segment
-    combined_audio = AudioSegment.empty()
-
-    # Get a list of all .wav files in the specified input directory and sort them
-    input_file_paths = sorted(
-        [os.path.join(input_directory, f) for f in os.listdir(input_directory) if f.endswith(".wav")],
-        key=lambda f: int(''.join(filter(str.isdigit, f)))
-    )
-
-    # Sequentially append each file to the combined_audio
-    for input_file_path in input_file_paths:
-        audio_segment = AudioSegment.from_wav(input_file_path)
-        combined_audio += audio_segment
-
-    # Export the combined audio to the output file path
-    combined_audio.export(output_file_path, format='wav')
-
-    print(f"Combined audio saved to {output_file_path}")
-
 # Function to split long strings into parts
 def split_long_sentence(sentence, max_length=249, max_pauses=10):
     """
@@ -359,10 +349,11 @@ def split_long_sentence(sentence, max_length=249, max_pauses=10):
     """
     parts = []
     while len(sentence) > max_length or sentence.count(',') + sentence.count(';') + sentence.count('.') > max_pauses:
-        possible_splits = [i for i, char in enumerate(sentence) if char in ',;.' and i < max_length]
-        if possible_splits:
+        # Last pause before max_length, one C-level rfind per punctuation mark instead of a Python scan
+        last_split = max(sentence.rfind(p, 0, max_length) for p in ',;.')
+        if last_split >= 0:
             # Find the best place to split the sentence, preferring the last possible split to keep parts longer
-            split_at = possible_splits[-1] + 1
+            split_at = last_split + 1
         else:
             # If no punctuation to split on within max_length, split at max_length
             split_at = max_length
@@ -389,45 +380,50 @@ def convert_chapters_to_audio(chapters_dir, output_audio_dir, target_voice_path=
     if not os.path.exists(output_audio_dir):
         os.makedirs(output_audio_dir)
 
-    for chapter_file in sorted(os.listdir(chapters_dir)):
-        if chapter_file.endswith('.txt'):
-            # Extract chapter number from the filename
-            match = re.search(r"chapter_(\d+).txt", chapter_file)
-            if match:
-                chapter_num = int(match.group(1))
-            else:
-                print(f"Skipping file {chapter_file} as it does not match the expected format.")
-                continue
-
-            chapter_path = os.path.join(chapters_dir, chapter_file)
-            output_file_name = f"audio_chapter_{chapter_num}.wav"
-            output_file_path = os.path.join(output_audio_dir, output_file_name)
-            temp_audio_directory = os.path.join(".", "Working_files", "temp")
-            os.makedirs(temp_audio_directory, exist_ok=True)
-            temp_count = 0
-
-            with open(chapter_path, 'r', encoding='utf-8') as file:
-                chapter_text = file.read()
-                # Use the specified language model for sentence tokenization
-                sentences = sent_tokenize(chapter_text, language='italian' if language == 'it' else 'english')
-                for sentence in tqdm(sentences, desc=f"Chapter {chapter_num}"):
-                    fragments = []
-                    if language == "en":
-                        fragments = split_long_sentence(sentence, max_length=249, max_pauses=10)
-                    if language == "it":
-                        fragments = split_long_sentence(sentence, max_length=213, max_pauses=10)
-                    for fragment in fragments:
-                        if fragment != "": #a hot fix to avoid blank fragments
-                            print(f"Generating fragment: {fragment}...")
-                            fragment_file_path = os.path.join(temp_audio_directory, f"{temp_count}.wav")
-                            speaker_wav_path = target_voice_path if target_voice_path else default_target_voice_path
-                            language_code = language if language else default_language_code
-                            tts.tts_to_file(text=fragment, file_path=fragment_file_path, speaker_wav=speaker_wav_path, language=language_code)
-                            temp_count += 1
-
-            combine_wav_files(temp_audio_directory, output_audio_dir, output_file_name)
-            wipe_folder(temp_audio_directory)
-            print(f"Converted chapter {chapter_num} to audio.")
+    # Per-book settings, resolved once rather than for every fragment
+    speaker_wav_path = target_voice_path if target_voice_path else default_target_voice_path
+    language_code = language if language else default_language_code
+    nltk_language = 'italian' if language == 'it' else 'english'
+    max_length = {"en": 249, "it": 213}.get(language)
+    sample_rate = tts.synthesizer.output_sample_rate
+
+    # One directory pass, chapters parsed once and processed in numeric order
+    chapter_entries = []
+    with os.scandir(chapters_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.txt'):
+                match = chapter_file_pattern.search(entry.name)
+                if match:
+                    chapter_entries.append((int(match.group(1)), entry.path))
+                else:
+                    print(f"Skipping file {entry.name} as it does not match the expected format.")
+
+    for chapter_num, chapter_path in sorted(chapter_entries):
+        output_file_name = f"audio_chapter_{chapter_num}.wav"
+        output_file_path = os.path.join(output_audio_dir, output_file_name)
+
+        with open(chapter_path, 'r', encoding='utf-8') as file:
+            chapter_text = file.read()
+        # Use the specified language model for sentence tokenization
+        sentences = sent_tokenize(chapter_text, language=nltk_language)
+        # Fragments are appended straight to the chapter wav, wave patches the header sizes on close
+        with open(output_file_path, 'wb', buffering=1 << 20) as wav_fp, wave.open(wav_fp, 'wb') as chapter_wav:
+            chapter_wav.setnchannels(1)
+            chapter_wav.setsampwidth(2)
+            chapter_wav.setframerate(sample_rate)
+            for sentence in tqdm(sentences, desc=f"Chapter {chapter_num}"):
+                fragments = []
+                if max_length:
+                    # Blank fragments are dropped here so they never reach tts
+                    fragments = [fragment for fragment in split_long_sentence(sentence, max_length=max_length, max_pauses=10) if fragment]
+                for fragment in fragments:
+                    print(f"Generating fragment: {fragment}...")
+                    wav = np.asarray(tts.tts(text=fragment, speaker_wav=speaker_wav_path, language=language_code), dtype=np.float32)
+                    # Same peak normalization tts_to_file applies before writing int16
+                    wav *= 32767 / max(0.01, float(np.abs(wav).max()))
+                    chapter_wav.writeframesraw(wav.astype(np.int16).tobytes())
+
+        print(f"Converted chapter {chapter_num} to audio.")
 
 
 
@@ -1,4 +1,6 @@
+import contextlib
 import gc
+import hashlib
 import numpy as np
 import os
 import regex as re
@@ -10,6 +12,8 @@ import torchaudio
 import threading
 import uuid
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI
 from huggingface_hub import hf_hub_download
 from scipy.io import wavfile as wav
@@ -22,11 +26,13 @@ from lib.models import *
 from lib.conf import models_dir, default_audio_proc_format
 
 torch.backends.cudnn.benchmark = True
+# Allow TF32 matmuls on Ampere+, inference does not need full fp32 precision
+torch.set_float32_matmul_precision('high')
 #torch.serialization.add_safe_globals(["numpy.core.multiarray.scalar"])
 
 app = FastAPI()
 lock = threading.Lock()
-loaded_tts = {}
+loaded_tts = OrderedDict()  # LRU order, least recently used first
 
 @app.post("/load_coqui_tts_api/")
 def load_coqui_tts_api(model_path, device):
@@ -37,6 +43,7 @@ def load_coqui_tts_api(model_path, device):
                 tts.cuda()
             else:
                 tts.to(device)
+            tts.eval()
         return tts
     except Exception as e:
         error = f'load_coqui_tts_api() error: {e}'
@@ -55,7 +62,8 @@ def load_coqui_tts_checkpoint(model_path, config_path, vocab_path, device):
                 config,
                 checkpoint_path=model_path,
                 vocab_path=vocab_path,
-                use_deepspeed=default_xtts_settings['use_deepspeed'],
+                # DeepSpeed inference kernels only exist for CUDA
+                use_deepspeed=default_xtts_settings['use_deepspeed'] and device == 'cuda',
                 eval=True
             )
         if device == 'cuda':
@@ -72,7 +80,7 @@ def load_coqui_tts_checkpoint(model_path, config_path, vocab_path, device):
 def load_coqui_tts_vc(device):
     try:
         with lock:
-            tts = TtsXTTS(default_vc_model).to(device)
+            tts = TtsXTTS(default_vc_model).to(device).eval()
         return tts
     except Exception as e:
         error = f'load_coqui_tts_vc() error: {e}'
@@ -87,6 +95,9 @@ class TTSManager:
         self.model_path = None
         self.config_path = None
         self.vocab_path = None      
+        # One writer thread so file encoding overlaps the next sentence inference
+        self.save_executor = ThreadPoolExecutor(max_workers=1)
+        self.pending_saves = []
         self._build()
  
     def _build(self):
@@ -103,8 +114,7 @@ class TTSManager:
                 if self.session['custom_model'] in loaded_tts.keys():
                     self.params['tts'] = loaded_tts[self.session['custom_model']]
                 else:
-                    if len(loaded_tts) == max_tts_in_memory:
-                        self.unload_tts()
+                    self._make_room(tts_key)
                     self.params['tts'] = load_coqui_tts_checkpoint(self.model_path, self.config_path, self.vocab_path, self.session['device'])
             elif self.session['fine_tuned'] != 'internal':
                 msg = f"Loading TTS {self.session['tts_engine']} model, it takes a while, please be patient..."
@@ -119,6 +129,7 @@ class TTSManager:
                 if tts_key in loaded_tts.keys():
                     self.params['tts'] = loaded_tts[hf_sub]
                 else:
+                    self._make_room(tts_key)
                     self.params['tts'] = load_coqui_tts_checkpoint(self.model_path, self.config_path, self.vocab_path, self.session['device'])
             else:
                 msg = f"Loading TTS {models[self.session['tts_engine']][self.session['fine_tuned']]['repo']} model, it takes a while, please be patient..."
@@ -128,6 +139,7 @@ class TTSManager:
                 if tts_key in loaded_tts.keys():
                     self.params['tts'] = loaded_tts[self.model_path]
                 else:
+                    self._make_room(tts_key)
                     self.params['tts'] = load_coqui_tts_api(self.model_path, self.session['device'])
         elif self.session['tts_engine'] == BARK:
             if self.session['custom_model'] is not None:
@@ -140,6 +152,7 @@ class TTSManager:
                 if tts_key in loaded_tts.keys():
                     self.params['tts'] = loaded_tts[tts_key]
                 else:
+                    self._make_room(tts_key)
                     self.params['tts'] = load_coqui_tts_api(self.model_path, self.session['device'])
         elif self.session['tts_engine'] == VITS:
             if self.session['custom_model'] is not None:
@@ -154,6 +167,7 @@ class TTSManager:
                 if tts_key in loaded_tts.keys():
                     self.params['tts'] = loaded_tts[tts_key]
                 else:
+                    self._make_room(tts_key)
                     self.params['tts'] = load_coqui_tts_api(self.model_path, self.session['device'])
                 if self.session['voice'] is not None:
                     tts_vc_key = default_vc_model
@@ -174,6 +188,7 @@ class TTSManager:
                 if tts_key in loaded_tts.keys():
                     self.params['tts'] = loaded_tts[tts_key]
                 else:
+                    self._make_room(tts_key)
                     self.params['tts'] = load_coqui_tts_api(self.model_path, self.session['device'])
                 if self.session['voice'] is not None:
                     tts_vc_key = default_vc_model
@@ -194,9 +209,13 @@ class TTSManager:
                 if tts_key in loaded_tts.keys():
                     self.params['tts'] = loaded_tts[self.model_path]
                 else:
+                    self._make_room(tts_key)
                     self.params['tts'] = load_coqui_tts_api(self.model_path, self.session['device'])
         if self.params['tts'] is not None:
             loaded_tts[tts_key] = self.params['tts']
+            loaded_tts.move_to_end(tts_key)
+            while len(loaded_tts) > max_tts_in_memory and self._unload_tts(keep=tts_key):
+                pass
             
     def _detect_gender(self, voice_path):
         try:
@@ -229,14 +248,22 @@ class TTSManager:
     def _is_tts_active(self, tts):
         return any(obj is tts for obj in gc.get_objects())
 
-    def _unload_tts():
-         for key in list(loaded_tts.keys()):
-            if key != default_vc_model:
+    def _make_room(self, keep):
+        # Evict before loading so no more than max_tts_in_memory models are ever resident
+        while len(loaded_tts) >= max_tts_in_memory and self._unload_tts(keep=keep):
+            pass
+
+    def _unload_tts(self, keep=None):
+        # Evict the least recently used model, the vc model stays resident
+        for key in list(loaded_tts.keys()):
+            if key != default_vc_model and key != keep:
                 del loaded_tts[key]
                 gc.collect()
-                torch.cuda.empty_cache()
-                torch.cuda.synchronize()
-                break
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                    torch.cuda.synchronize()
+                return True
+        return False
 
     def _tensor_type(self, audio_data):
         if isinstance(audio_data, torch.Tensor):
@@ -244,13 +271,116 @@ class TTSManager:
         elif isinstance(audio_data, np.ndarray):  
             return torch.from_numpy(audio_data).float()
         elif isinstance(audio_data, list):  
-            return torch.tensor(audio_data, dtype=torch.float32)
+            # numpy converts a float list in one C pass, torch.tensor boxes every element
+            return torch.from_numpy(np.asarray(audio_data, dtype=np.float32))
         else:
             raise TypeError(f"Unsupported type for audio_data: {type(audio_data)}")
 
+    def _save_audio(self, audio_file, audio_tensor, sample_rate):
+        try:
+            torchaudio.save(audio_file, audio_tensor, sample_rate, format=default_audio_proc_format)
+            if os.path.exists(audio_file):
+                return True
+            error = f"Cannot create {audio_file}"
+        except Exception as e:
+            error = f'_save_audio(): {e}'
+        print(error)
+        return False
+
+    def wait_pending_saves(self):
+        results = [future.result() for future in self.pending_saves]
+        self.pending_saves = []
+        return all(results)
+
+    def close(self):
+        # Queued sentence files land before the caller looks at the directory again, then the writer thread goes
+        try:
+            return self.wait_pending_saves()
+        finally:
+            self.save_executor.shutdown(wait=True)
+
+    def _autocast(self, xtts_model):
+        # fp16 rather than bf16: xtts converts its output to numpy, which has no bfloat16
+        if self.session['device'] == 'cuda':
+            self._keep_vocoder_fp32(xtts_model)
+            return torch.autocast(device_type='cuda', dtype=torch.float16)
+        return contextlib.nullcontext()
+
+    def _keep_vocoder_fp32(self, xtts_model):
+        # Only the GPT runs in half precision, fp16 HiFi-GAN convolutions produce audible artifacts
+        decoder = xtts_model.hifigan_decoder
+        if getattr(decoder, 'fp32_forward', False):
+            return
+        forward = decoder.forward
+        def fp32_forward(latents, g=None):
+            with torch.autocast(device_type='cuda', enabled=False):
+                return forward(latents.float(), g=g.float() if g is not None else None)
+        decoder.forward = fp32_forward
+        decoder.fp32_forward = True
+
+    def _get_conditioning_latents(self, xtts_model, from_config=False):
+        latents_settings = {}
+        if from_config:
+            # The internal model used to go through tts(), which reads these reference settings from its config.
+            # Custom and fine-tuned models always used the get_conditioning_latents() defaults
+            config = xtts_model.config
+            latents_settings = {
+                'gpt_cond_len': config.gpt_cond_len,
+                'gpt_cond_chunk_len': config.gpt_cond_chunk_len,
+                'max_ref_length': config.max_ref_len,
+                'sound_norm_refs': config.sound_norm_refs
+            }
+        # Latents only depend on the reference wav, the model and those settings, cache them on disk
+        hash_func = hashlib.blake2b(digest_size=16)
+        with open(self.params['voice_path'], 'rb') as f:
+            hash_func.update(f.read())
+        hash_func.update(str(self.model_path).encode())
+        if latents_settings:
+            hash_func.update(repr(sorted(latents_settings.items())).encode())
+        latents_dir = os.path.join(models_dir, 'tts', 'latents')
+        latents_path = os.path.join(latents_dir, f'{hash_func.hexdigest()}.latents.pt')
+        if os.path.exists(latents_path):
+            try:
+                gpt_cond_latent, speaker_embedding = torch.load(latents_path, map_location=self.session['device'])
+                # mtime is the recency used by _prune_latents
+                os.utime(latents_path)
+                return gpt_cond_latent, speaker_embedding
+            except Exception as e:
+                print(f'Cannot load cached latents {latents_path}: {e}')
+        msg = 'Computing speaker latents...'
+        print(msg)
+        gpt_cond_latent, speaker_embedding = xtts_model.get_conditioning_latents(audio_path=[self.params['voice_path']], **latents_settings)
+        os.makedirs(latents_dir, exist_ok=True)
+        # Written aside then renamed, a crash or a concurrent writer never leaves a truncated file to load
+        fd, tmp_path = tempfile.mkstemp(dir=latents_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                torch.save((gpt_cond_latent.cpu(), speaker_embedding.cpu()), f)
+            os.replace(tmp_path, latents_path)
+        except Exception as e:
+            print(f'Cannot cache latents {latents_path}: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._prune_latents(latents_dir)
+        return gpt_cond_latent, speaker_embedding
+
+    def _prune_latents(self, latents_dir):
+        # Keep the max_cached_latents most recently used files
+        try:
+            with os.scandir(latents_dir) as entries:
+                files = [(entry.stat().st_mtime_ns, entry.path) for entry in entries if entry.name.endswith('.latents.pt')]
+            if len(files) <= max_cached_latents:
+                return
+            files.sort()
+            for _, path in files[:len(files) - max_cached_latents]:
+                os.remove(path)
+        except Exception as e:
+            print(f'_prune_latents(): {e}')
+
     def convert_sentence_to_audio(self):
         try:
             audio_data = None
+            audio_tensor = None
             fine_tuned_params = {
                 key: cast_type(self.session[key])
                 for key, cast_type in {
@@ -275,11 +405,9 @@ class TTSManager:
             if self.session['tts_engine'] == XTTSv2:
                 if self.session['custom_model'] is not None or self.session['fine_tuned'] != 'internal':
                     if self.params['current_voice_path'] != self.params['voice_path']:
-                        msg = 'Computing speaker latents...'
-                        print(msg)
                         self.params['current_voice_path'] = self.params['voice_path']
-                        self.params['gpt_cond_latent'], self.params['speaker_embedding'] = self.params['tts'].get_conditioning_latents(audio_path=[self.params['voice_path']])
-                    with torch.no_grad():
+                        self.params['gpt_cond_latent'], self.params['speaker_embedding'] = self._get_conditioning_latents(self.params['tts'])
+                    with torch.no_grad(), self._autocast(self.params['tts']):
                         result = self.params['tts'].inference(
                             text=self.params['sentence'],
                             language=self.session['language_iso1'],
@@ -295,18 +423,36 @@ class TTSManager:
                 else:
                     voice_name = re.sub(r'_(24000|16000)\.wav$', '', os.path.basename(os.path.basename(self.params['voice_path'])))
                     if voice_name in default_xtts_settings['voices'].values():
-                        speaker_argument = {"speaker": voice_name}
+                        with torch.no_grad(), self._autocast(self.params['tts'].synthesizer.tts_model):
+                            audio_data = self.params['tts'].tts(
+                                text=self.params['sentence'],
+                                language=self.session['language_iso1'],
+                                speaker=voice_name,
+                                **fine_tuned_params
+                            )
                     else:
+                        # tts(speaker_wav=...) recomputes the latents on every call,
+                        # go through the underlying Xtts model with the cached ones
+                        synthesizer = self.params['tts'].synthesizer
+                        xtts_model = synthesizer.tts_model
                         if self.params['current_voice_path'] != self.params['voice_path']:
                             self.params['current_voice_path'] = self.params['voice_path']
-                        speaker_argument = {"speaker_wav": self.params['voice_path']}
-                    with torch.no_grad():
-                        audio_data = self.params['tts'].tts(
-                            text=self.params['sentence'],
-                            language=self.session['language_iso1'],
-                            **speaker_argument,
-                            **fine_tuned_params
-                        )
+                            self.params['gpt_cond_latent'], self.params['speaker_embedding'] = self._get_conditioning_latents(xtts_model, from_config=True)
+                        wav_parts = []
+                        with torch.no_grad(), self._autocast(xtts_model):
+                            # Same sentence split and 10000 samples of silence after each part as tts() does
+                            for text_part in synthesizer.split_into_sentences(self.params['sentence']):
+                                result = xtts_model.inference(
+                                    text=text_part,
+                                    language=self.session['language_iso1'],
+                                    gpt_cond_latent=self.params['gpt_cond_latent'],
+                                    speaker_embedding=self.params['speaker_embedding'],
+                                    **fine_tuned_params
+                                )
+                                wav_parts.append(np.asarray(result['wav'], dtype=np.float32))
+                                wav_parts.append(np.zeros(10000, dtype=np.float32))
+                        if wav_parts:
+                            audio_data = np.concatenate(wav_parts)
             elif self.session['tts_engine'] == BARK:
                 '''
                     [laughter]
@@ -455,12 +601,13 @@ class TTSManager:
             if audio_data is not None:
                 sourceTensor = self._tensor_type(audio_data)
                 #audio_tensor = torch.tensor(audio_data, dtype=torch.float32).unsqueeze(0).cpu()
-                audio_tensor = sourceTensor.clone().detach().unsqueeze(0).cpu()
-                torchaudio.save(self.params['sentence_audio_file'], audio_tensor, sample_rate, format=default_audio_proc_format)
+                # No clone: the waveform is fresh per sentence and never touched again
+                audio_tensor = sourceTensor.detach().unsqueeze(0).cpu()
+                self.pending_saves.append(
+                    self.save_executor.submit(self._save_audio, self.params['sentence_audio_file'], audio_tensor, sample_rate)
+                )
                 del audio_data
-            if self.session['device'] == 'cuda':
-                torch.cuda.empty_cache()         
-            if os.path.exists(self.params['sentence_audio_file']):
+            if audio_tensor is not None:
                 return True
             error = f"Cannot create {self.params['sentence_audio_file']}"
             print(error)
@@ -13,6 +13,8 @@ from torchvggish import vggish, vggish_input
 from lib.conf import voice_formats
 from lib.models import XTTSv2, models
 
+ffmpeg_bin = shutil.which('ffmpeg') or 'ffmpeg'
+
 class VoiceExtractor:
 
     def __init__(self, session, models_dir, voice_file, voice_name):
@@ -38,7 +40,7 @@ class VoiceExtractor:
         try:
             self.wav_file = os.path.join(self.session['voice_dir'], f'{self.voice_name}.wav')
             ffmpeg_cmd = [
-                shutil.which('ffmpeg'), '-i', self.voice_file,
+                ffmpeg_bin, '-i', self.voice_file,
                 '-ac', '1',
                 '-y', self.wav_file
             ]
@@ -210,7 +212,7 @@ class VoiceExtractor:
     def _normalize_audio(self):
         try:                 
             process_file = os.path.join(self.session['voice_dir'], f'{self.voice_name}.wav')
-            ffmpeg_cmd = [shutil.which('ffmpeg'), '-i', self.voice_track]
+            ffmpeg_cmd = [ffmpeg_bin, '-i', self.voice_track]
             filter_complex = (
                 'agate=threshold=-25dB:ratio=1.4:attack=10:release=250,'
                 'afftdn=nf=-70,'
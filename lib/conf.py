@@ -24,6 +24,7 @@ os.environ['HF_TOKEN_PATH'] = os.path.join(os.path.expanduser('~'), '.huggingfac
 os.environ['TTS_CACHE'] = models_dir
 os.environ['TORCH_HOME'] = models_dir
 os.environ['TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD'] = '1'
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True') # sentence lengths vary a lot, limits allocator fragmentation
 os.environ['XDG_CACHE_HOME'] = models_dir
 os.environ["SUNO_OFFLOAD_CPU"] = 'False' # BARK option: False needs A GPU
 os.environ["SUNO_USE_SMALL_MODELS"] = 'False' # BARK option: False needs a GPU with VRAM > 4GB
@@ -50,6 +51,7 @@ interface_host = '0.0.0.0'
 interface_port = 7860
 interface_shared_tmp_expire = 3 # in days
 interface_concurrency_limit = 1 # or None for unlimited
+interface_max_sessions = int(os.environ.get('INTERFACE_MAX_SESSIONS', 256)) # idle sessions beyond this are dropped, oldest first
 
 interface_component_options = {
     "gr_tab_preferences": True,
@@ -13,8 +13,12 @@ import fnmatch
 import gc
 import gradio as gr
 import hashlib
+import html
+import itertools
 import json
 import math
+import mmap
+import orjson
 import os
 import platform
 import psutil
@@ -31,6 +35,7 @@ import time
 import torch
 import urllib.request
 import uuid
+import xxhash
 import zipfile
 import traceback
 
@@ -39,28 +44,27 @@ import lib.lang as lang
 import lib.models as mod
 
 from bs4 import BeautifulSoup
-from collections import Counter
+from collections import Counter, OrderedDict
 from collections.abc import Mapping
 from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from ebooklib import epub
 from fastapi import FastAPI
+from functools import lru_cache, partial
 from glob import glob
 from iso639 import languages
-from multiprocessing import Manager, Event
+from multiprocessing import Event
 from multiprocessing.managers import DictProxy, ListProxy
+from operator import itemgetter
 from num2words import num2words
 from pathlib import Path
-from pydub import AudioSegment
 from queue import Queue, Empty
 from starlette.requests import ClientDisconnect
 from tqdm import tqdm
-from types import MappingProxyType
 from urllib.parse import urlparse
 
 from lib.classes.redirect_console import RedirectConsole
-from lib.classes.voice_extractor import VoiceExtractor
-from lib.classes.tts_manager import TTSManager
 
 def inject_configs(target_namespace):
     # Extract variables from both modules and inject them into the target namespace
@@ -70,6 +74,27 @@ def inject_configs(target_namespace):
 # Inject configurations into the global namespace of this module
 inject_configs(globals())
 
+# Resolved once, every concat/export call used to walk $PATH again
+ffmpeg_bin = shutil.which('ffmpeg') or 'ffmpeg'
+
+# Text processing patterns and tables, built once instead of on every chapter
+punctuation_switch_table = str.maketrans({k: v for k, v in punctuation_switch.items() if len(k) == 1})
+punctuation_split_tuple = tuple(punctuation_split)
+abbreviations_patterns = {
+    code: re.compile(r'\b(' + '|'.join(re.escape(k) for k in mapping) + r')\b')
+    for code, mapping in abbreviations_mapping.items()
+}
+newlines_pattern = re.compile(r'(\r\n|\r|\n)+')
+newline_pattern = re.compile(r'[\r\n]')
+tabs_pattern = re.compile(r'\t+')
+letter_digit_pattern = re.compile(r'(?<=[\p{L}])(?=\d)|(?<=\d)(?=[\p{L}])')
+punctuation_space_pattern = re.compile(r'\s*([{}])\s*'.format(re.escape(''.join(punctuation_list)).replace(',', '').replace('.', '')))
+comma_dot_pattern = re.compile(r'(?<!\d)\s*(\.{3}|[,.])\s*(?!\d)')
+punctuation_split_escaped = re.escape(''.join(punctuation_split))
+phoneme_split_pattern = re.compile(f"[^{punctuation_split_escaped}]+[{punctuation_split_escaped}]?|[{punctuation_split_escaped}]")
+digits_pattern = re.compile(r'\d+')
+voice_rate_pattern = re.compile(r'_(24000|16000)\.wav$')
+
 class DependencyError(Exception):
     def __init__(self, message=None):
         super().__init__(message)
@@ -86,35 +111,81 @@ class DependencyError(Exception):
         if not is_gui_process:
             sys.exit(1)
 
-def recursive_proxy(data, manager=None):
-    if manager is None:
-        manager = Manager()
-    if isinstance(data, dict):
-        proxy_dict = manager.dict()
-        for key, value in data.items():
-            proxy_dict[key] = recursive_proxy(value, manager)
-        return proxy_dict
-    elif isinstance(data, list):
-        proxy_list = manager.list()
-        for item in data:
-            proxy_list.append(recursive_proxy(item, manager))
-        return proxy_list
-    elif isinstance(data, (str, int, float, bool, type(None))):
-        return data
-    else:
-        error = f"Unsupported data type: {type(data)}"
-        print(error)
-        return
+class SessionDict(dict):
+    # Tracks writes so save_session can skip an unchanged session without hashing it.
+    # Revisions come from one process wide counter, a recreated session never repeats an old value
+    __slots__ = ('revision',)
+    revisions = itertools.count(1)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.touch()
+
+    def touch(self):
+        # Also to be called after nested writes such as session['metadata'][key] = value
+        self.revision = next(SessionDict.revisions)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.touch()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.touch()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.touch()
 
 class SessionContext:
     def __init__(self):
-        self.manager = Manager()
-        self.sessions = self.manager.dict()  # Store all session-specific contexts
+        # Plain dicts: sessions only live in this process, a Manager proxy
+        # would turn every session[...] access into an IPC round-trip
+        self.sessions = OrderedDict()  # Store all session-specific contexts, least recently used first
         self.cancellation_events = {}  # Store multiprocessing.Event for each session
+        self.tabs = {}  # Count of open browser tabs bound to each session
+        # Gradio handler threads and the gr.State delete_callback all touch sessions and tabs
+        self.lock = threading.Lock()
+
+    def bind_tab(self, id):
+        with self.lock:
+            self.tabs[id] = self.tabs.get(id, 0) + 1
+
+    def release_tab(self, state):
+        # gr.State delete_callback: drop the session once its last tab is gone
+        id = state.get('id') if state else None
+        with self.lock:
+            if id is None or id not in self.tabs:
+                return
+            self.tabs[id] -= 1
+            if self.tabs[id] > 0:
+                return
+            del self.tabs[id]
+            session = self.sessions.get(id)
+            if session is not None and session['status'] != 'converting':
+                del self.sessions[id]
+                self.cancellation_events.pop(id, None)
+
+    def evict_idle_sessions(self, keep):
+        # Caller holds self.lock. Only sessions with no open tab and no running conversion can go
+        for id in list(self.sessions):
+            if len(self.sessions) < interface_max_sessions:
+                break
+            if id == keep or id in self.tabs or self.sessions[id]['status'] == 'converting':
+                continue
+            del self.sessions[id]
+            self.cancellation_events.pop(id, None)
 
     def get_session(self, id):
-        if id not in self.sessions:
-            self.sessions[id] = recursive_proxy({
+        with self.lock:
+            return self._get_session(id)
+
+    def _get_session(self, id):
+        if id in self.sessions:
+            self.sessions.move_to_end(id)
+        else:
+            self.evict_idle_sessions(keep=id)
+            self.sessions[id] = SessionDict({
                 "script_mode": NATIVE,
                 "id": id,
                 "process_id": None,
@@ -174,7 +245,7 @@ class SessionContext:
                     "Source": None,
                     "Modified": None,
                 }
-            }, manager=self.manager)
+            })
         return self.sessions[id]
 
 app = FastAPI()
@@ -232,17 +303,16 @@ def analyze_uploaded_file(zip_path, required_files):
             error = f"The file does not exist: {os.path.basename(zip_path)}"
             print(error)
             return False
-        files_in_zip = {}
+        files_in_zip = set()
         empty_files = set()
         with zipfile.ZipFile(zip_path, 'r') as zf:
             for file_info in zf.infolist():
-                file_name = file_info.filename
                 if file_info.is_dir():
                     continue
-                base_name = os.path.basename(file_name)
-                files_in_zip[base_name.lower()] = file_info.file_size
+                base_name = os.path.basename(file_info.filename).lower()
+                files_in_zip.add(base_name)
                 if file_info.file_size == 0:
-                    empty_files.add(base_name.lower())
+                    empty_files.add(base_name)
         required_files = [file.lower() for file in required_files]
         missing_files = [f for f in required_files if f not in files_in_zip]
         required_empty_files = [f for f in required_files if f in empty_files]
@@ -265,19 +335,23 @@ def extract_custom_model(file_src, session, required_files=None):
             required_files = models[session['tts_engine']][default_fine_tuned]['files']
         model_name = re.sub('.zip', '', os.path.basename(file_src), flags=re.IGNORECASE)
         model_name = get_sanitized(model_name)
+        tts_dir = session['tts_engine']    
+        model_path = os.path.join(session['custom_model_dir'], tts_dir, model_name)
+        # Nothing to read from the archive when the model is already extracted
+        if os.path.exists(model_path):
+            print(f'{model_path} already exists, bypassing files extraction')
+            return model_path
         with zipfile.ZipFile(file_src, 'r') as zip_ref:
-            files = zip_ref.namelist()
+            # Only the required entries get extracted, size tqdm on those alone
+            required_set = set(required_files)
+            files = [f for f in zip_ref.namelist() if f in required_set]
             files_length = len(files)
-            tts_dir = session['tts_engine']    
-            model_path = os.path.join(session['custom_model_dir'], tts_dir, model_name)
-            if os.path.exists(model_path):
-                print(f'{model_path} already exists, bypassing files extraction')
-                return model_path
             os.makedirs(model_path, exist_ok=True)
             with tqdm(total=files_length, unit='files') as t:
                 for f in files:
-                    if f in required_files:
-                        zip_ref.extract(f, model_path)
+                    # Required entries are top-level files, stream them straight out with 1 MiB chunks
+                    with zip_ref.open(f) as src, open(os.path.join(model_path, f), 'wb') as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
                     t.update(1)
         if is_gui_process:
             os.remove(file_src)
@@ -300,59 +374,79 @@ def extract_custom_model(file_src, session, required_files=None):
         return None
         
 def hash_proxy_dict(proxy_dict):
-    return hashlib.md5(str(proxy_dict).encode('utf-8')).hexdigest()
+    # xxh3 over a canonical (sorted keys) json bytes view, orjson walks the nested
+    # values natively so only foreign objects (i.e. toc items) go through str()
+    data = orjson.dumps(dict(proxy_dict), default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return xxhash.xxh3_64(data).hexdigest()
 
-def calculate_hash(filepath, hash_algorithm='sha256'):
+def calculate_hash(filepath, hash_algorithm='blake2b'):
     hash_func = hashlib.new(hash_algorithm)
     with open(filepath, 'rb') as f:
-        while chunk := f.read(8192):  # Read in chunks to handle large files
-            hash_func.update(chunk)
+        if os.fstat(f.fileno()).st_size > 0:  # mmap cannot map an empty file
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hash_func.update(mm)
     return hash_func.hexdigest()
 
-def compare_files_by_hash(file1, file2, hash_algorithm='sha256'):
+def compare_files_by_hash(file1, file2, hash_algorithm='blake2b'):
+    # Different sizes can never match, skip hashing
+    if os.path.getsize(file1) != os.path.getsize(file2):
+        return False
     return calculate_hash(file1, hash_algorithm) == calculate_hash(file2, hash_algorithm)
 
 def compare_dict_keys(d1, d2):
     if not isinstance(d1, Mapping) or not isinstance(d2, Mapping):
         return d1 == d2
-    d1_keys = set(d1.keys())
-    d2_keys = set(d2.keys())
-    missing_in_d2 = d1_keys - d2_keys
-    missing_in_d1 = d2_keys - d1_keys
-    if missing_in_d2 or missing_in_d1:
-        return {
-            "missing_in_d2": missing_in_d2,
-            "missing_in_d1": missing_in_d1,
-        }
-    for key in d1_keys.intersection(d2_keys):
-        nested_result = compare_keys(d1[key], d2[key])
-        if nested_result:
-            return {key: nested_result}
+    # Iterative walk, the first key mismatch found is returned nested under its key path
+    stack = [((), d1, d2)]
+    while stack:
+        path, sub1, sub2 = stack.pop()
+        d1_keys = set(sub1.keys())
+        d2_keys = set(sub2.keys())
+        missing_in_d2 = d1_keys - d2_keys
+        missing_in_d1 = d2_keys - d1_keys
+        if missing_in_d2 or missing_in_d1:
+            result = {
+                "missing_in_d2": missing_in_d2,
+                "missing_in_d1": missing_in_d1,
+            }
+            for key in reversed(path):
+                result = {key: result}
+            return result
+        for key in d1_keys.intersection(d2_keys):
+            if isinstance(sub1[key], Mapping) and isinstance(sub2[key], Mapping):
+                stack.append((path + (key,), sub1[key], sub2[key]))
     return None
 
 def proxy_to_dict(proxy_obj):
-    def recursive_copy(source, visited):
-        # Handle circular references by tracking visited objects
-        if id(source) in visited:
-            return None  # Stop processing circular references
-        visited.add(id(source))  # Mark as visited
-        if isinstance(source, dict):
-            result = {}
-            for key, value in source.items():
-                result[key] = recursive_copy(value, visited)
-            return result
-        elif isinstance(source, list):
-            return [recursive_copy(item, visited) for item in source]
+    def convert(source):
+        # Scalars are returned as is, containers come back empty with the items to fill them
+        if isinstance(source, (dict, DictProxy)):
+            return {}, list(dict(source).items())  # One snapshot per DictProxy
+        elif isinstance(source, (list, ListProxy)):
+            source = list(source)
+            return [None] * len(source), list(enumerate(source))
         elif isinstance(source, set):
-            return list(source)
+            return list(source), None
         elif isinstance(source, (int, float, str, bool, type(None))):
-            return source
-        elif isinstance(source, DictProxy):
-            # Explicitly handle DictProxy objects
-            return recursive_copy(dict(source), visited)  # Convert DictProxy to dict
+            return source, None
         else:
-            return str(source)  # Convert non-serializable types to strings
-    return recursive_copy(proxy_obj, set())
+            return str(source), None  # Convert non-serializable types to strings
+    visited = {id(proxy_obj)}
+    result, items = convert(proxy_obj)
+    stack = [(result, items)] if items is not None else []
+    while stack:
+        target, items = stack.pop()
+        for key, value in items:
+            if isinstance(value, (dict, list, DictProxy, ListProxy)):
+                # Handle circular references by tracking visited containers
+                if id(value) in visited:
+                    target[key] = None
+                    continue
+                visited.add(id(value))
+            target[key], children = convert(value)
+            if children is not None:
+                stack.append((target[key], children))
+    return result
 
 def math2word(text, lang, lang_iso1, tts_engine):
     def check_compat():
@@ -420,25 +514,23 @@ def math2word(text, lang, lang_iso1, tts_engine):
 
 def normalize_text(text, lang, lang_iso1, tts_engine):
     # Replace punctuations causing hallucinations
-    pattern = f"[{''.join(map(re.escape, punctuation_switch.keys()))}]"
-    text = re.sub(pattern, lambda match: punctuation_switch.get(match.group(), match.group()), text)
+    text = text.translate(punctuation_switch_table)
     # Replace NBSP with a normal space
     text = text.replace("\xa0", " ")
-    if lang in abbreviations_mapping:
-        pattern = r'\b(' + '|'.join(re.escape(k) for k in abbreviations_mapping[lang]) + r')\b'
-        text = re.sub(pattern, lambda match: abbreviations_mapping[lang].get(match.group(0), match.group(0)), text)
+    if lang in abbreviations_patterns:
+        text = abbreviations_patterns[lang].sub(lambda match: abbreviations_mapping[lang].get(match.group(0), match.group(0)), text)
     # Replace multiple newlines ("\n\n", "\r\r", "\n\r") with " . " as many times as they occur
     #text = re.sub('(\r\n|\n\n|\r\r|\n\r)+', lambda m: ' . ' * (m.group().count("\n") // 2 + m.group().count("\r") // 2), text)
     # Replace multiple newlines ("\n\n", "\r\r", "\n\r", etc.) with a single "\n"
-    text = re.sub(r'(\r\n|\r|\n)+', '\n', text)
+    text = newlines_pattern.sub('\n', text)
     # Replace single newlines ("\n" or "\r") with spaces
-    text = re.sub(r'[\r\n]', ' ', text)
+    text = newline_pattern.sub(' ', text)
     # Replace tabs ("\t") with equivalent spaces
-    text = re.sub(r'\t+', lambda m: ' ' * len(m.group()), text)
+    text = tabs_pattern.sub(lambda m: ' ' * len(m.group()), text)
     # replace roman numbers by digits
     text = replace_roman_numbers(text)
     # Pattern 1: Add a space between UTF-8 characters and numbers
-    text = re.sub(r'(?<=[\p{L}])(?=\d)|(?<=\d)(?=[\p{L}])', ' ', text)
+    text = letter_digit_pattern.sub(' ', text)
     # Replace math symbols with words
     text = math2word(text, lang, lang_iso1, tts_engine)
     return text
@@ -540,10 +632,13 @@ def get_chapters(epubBook, session):
         doc_cache = {}
         msg = '******* NOTE: YOU CAN SAFELY IGNORE "Character xx not found in the vocabulary." *******'
         print(msg)
+        pattern_cache = {}
+        # In process: a pool would fork the threaded gradio/torch server or re-import it in every spawned worker
         for doc in all_docs:
-            doc_cache[doc] = filter_chapter(doc, session['language'], session['language_iso1'], session['tts_engine'])
+            doc_cache[doc] = filter_chapter(doc.get_body_content(), session['language'], session['language_iso1'], session['tts_engine'])
+            pattern_cache[doc] = filter_pattern(str(doc))
         # Step 4: Determine the most common pattern
-        doc_patterns = [filter_pattern(str(doc)) for doc in all_docs if filter_pattern(str(doc))]
+        doc_patterns = [pattern for pattern in pattern_cache.values() if pattern]
         most_common_pattern = filter_doc(doc_patterns)
         # Step 5: Calculate average character length
         char_length = [len(content) for content in doc_cache.values()]
@@ -552,7 +647,7 @@ def get_chapters(epubBook, session):
         final_selected_docs = [
             doc for doc in all_docs
             if doc in doc_cache and doc_cache[doc]
-            and (len(doc_cache[doc]) >= average_char_length or filter_pattern(str(doc)) == most_common_pattern)
+            and (len(doc_cache[doc]) >= average_char_length or pattern_cache[doc] == most_common_pattern)
         ]
         # Step 7: Extract parts from the final selected docs
         chapters = [doc_cache[doc] for doc in final_selected_docs]
@@ -563,28 +658,22 @@ def get_chapters(epubBook, session):
         DependencyError(error)
         return None, None
 
-def filter_chapter(doc, lang, lang_iso1, tts_engine):
-    soup = BeautifulSoup(doc.get_body_content(), 'html.parser')
+def filter_chapter(content, lang, lang_iso1, tts_engine):
+    # lxml (C parser, already pulled in by ebooklib) is much faster than html.parser
+    soup = BeautifulSoup(content, 'lxml')
     # Remove scripts and styles
     for script in soup(["script", "style"]):
         script.decompose()
     # Normalize lines and remove unnecessary spaces and switch special chars
     text = normalize_text(soup.get_text().strip(), lang, lang_iso1, tts_engine)
-    # Rule 1: Ensure spaces before & after punctuation
-    pattern_space = re.escape(''.join(punctuation_list))
-    # Step 1: Ensure space before and after punctuation (excluding `,` and `.`)
-    punctuation_pattern_space = r'\s*([{}])\s*'.format(pattern_space.replace(',', '').replace('.', ''))
-    text = re.sub(punctuation_pattern_space, r' \1 ', text)
-    # Rule 2: Ensure spaces before & after `,` and `.` ONLY when NOT between numbers
-    comma_dot_pattern = r'(?<!\d)\s*(\.{3}|[,.])\s*(?!\d)'
-    # Step 2: Ensure space before and after `,` and `.` only when NOT between numbers
-    text = re.sub(comma_dot_pattern, r' \1 ', text)
-    # Create regex pattern from punctuation list to split the phoneme_list
-    pattern_split = f"[^{re.escape(''.join(punctuation_split))}]+[{re.escape(''.join(punctuation_split))}]?|[{re.escape(''.join(punctuation_split))}]"
+    # Rule 1: Ensure space before and after punctuation (excluding `,` and `.`)
+    text = punctuation_space_pattern.sub(r' \1 ', text)
+    # Rule 2: Ensure space before and after `,` and `.` only when NOT between numbers
+    text = comma_dot_pattern.sub(r' \1 ', text)
     if not text.strip():
         phoneme_list = []
     else:
-        tmp_list = re.findall(pattern_split, text)
+        tmp_list = phoneme_split_pattern.findall(text)
         phoneme_list = [item.strip() for item in tmp_list if item and item.strip() and item != ' ']
     # get the final sentence array according to the max_tokens limitation
     max_tokens = language_mapping[lang]['max_tokens']
@@ -618,16 +707,14 @@ def get_sentences(phoneme_list, max_tokens):
         # Always append to current sentence unless punctuation is hit
         if current_phoneme_count + part_phoneme_count > max_tokens:
             # Ensure we finalize the sentence at punctuation, not a space
-            if any(current_sentence.endswith(punc) for punc in punctuation_split):
+            if current_sentence.endswith(punctuation_split_tuple):
                 sentences.append(current_sentence.strip())
                 current_sentence = phoneme
                 current_phoneme_count = part_phoneme_count
             else:
                 # Look back and split at last punctuation instead of splitting randomly
-                last_punc_index = max(
-                    (current_sentence.rfind(punc) for punc in punctuation_split if punc in current_sentence),
-                    default=-1
-                )
+                # rfind already returns -1 when missing, no need for a prior "in" scan
+                last_punc_index = max(current_sentence.rfind(punc) for punc in punctuation_split_tuple)
                 if last_punc_index > -1:
                     sentences.append(current_sentence[:last_punc_index+1].strip())  # Keep punctuation
                     current_sentence = current_sentence[last_punc_index+1:].strip() + " " + phoneme
@@ -716,6 +803,18 @@ def get_sanitized(str, replacement="_"):
     return sanitized
 
 def convert_chapters_to_audio(session):
+    def combine_block(chapter_num, chapter_audio_file, start, end):
+        if combine_audio_sentences(chapter_audio_file, start, end, session):
+            msg = f'Combined block {chapter_num} to audio, sentence {start} to {end}'
+            print(msg)
+            return True
+        msg = 'combine_audio_sentences() failed!'
+        print(msg)
+        return False
+
+    # One worker: blocks are combined in order while the next block is synthesized
+    combine_executor = ThreadPoolExecutor(max_workers=1)
+    tts_manager = None
     try:
         if session['cancellation_requested']:
             print('Cancel requested')
@@ -723,47 +822,52 @@ def convert_chapters_to_audio(session):
         progress_bar = None
         if is_gui_process:
             progress_bar = gr.Progress(track_tqdm=True)        
+        # Heavy TTS/torchaudio import, only paid when a conversion actually runs
+        from lib.classes.tts_manager import TTSManager
         tts_manager = TTSManager(session, is_gui_process)
         if tts_manager.params['tts'] is None:
             return False
         resume_chapter = 0
-        missing_chapters = []
+        missing_chapters = set()
         resume_sentence = 0
-        missing_sentences = []
-        existing_chapters = sorted(
-            [f for f in os.listdir(session['chapters_dir']) if f.endswith(f'.{default_audio_proc_format}')],
-            key=lambda x: int(re.search(r'\d+', x).group())
-        )
-        if existing_chapters:
-            resume_chapter = max(int(re.search(r'\d+', f).group()) for f in existing_chapters) 
+        missing_sentences = set()
+        # Parse each file number once, sets keep the per sentence lookups O(1)
+        existing_chapter_numbers = {
+            int(digits_pattern.search(f).group())
+            for f in os.listdir(session['chapters_dir']) if f.endswith(f'.{default_audio_proc_format}')
+        }
+        if existing_chapter_numbers:
+            resume_chapter = max(existing_chapter_numbers)
             msg = f'Resuming from block {resume_chapter}'
             print(msg)
-            existing_chapter_numbers = {int(re.search(r'\d+', f).group()) for f in existing_chapters}
-            missing_chapters = [
+            missing_chapters = {
                 i for i in range(1, resume_chapter) if i not in existing_chapter_numbers
-            ]
-            if resume_chapter not in missing_chapters:
-                missing_chapters.append(resume_chapter)
-        existing_sentences = sorted(
-            [f for f in os.listdir(session['chapters_dir_sentences']) if f.endswith(f'.{default_audio_proc_format}')],
-            key=lambda x: int(re.search(r'\d+', x).group())
-        )
-        if existing_sentences:
-            resume_sentence = max(int(re.search(r'\d+', f).group()) for f in existing_sentences)
+            }
+            missing_chapters.add(resume_chapter)
+        existing_sentence_numbers = {
+            int(digits_pattern.search(f).group())
+            for f in os.listdir(session['chapters_dir_sentences']) if f.endswith(f'.{default_audio_proc_format}')
+        }
+        if existing_sentence_numbers:
+            resume_sentence = max(existing_sentence_numbers)
             msg = f"Resuming from sentence {resume_sentence}"
             print(msg)
-            existing_sentence_numbers = {int(re.search(r'\d+', f).group()) for f in existing_sentences}
-            missing_sentences = [
+            missing_sentences = {
                 i for i in range(1, resume_sentence) if i not in existing_sentence_numbers
-            ]
-            if resume_sentence not in missing_sentences:
-                missing_sentences.append(resume_sentence)
+            }
+            missing_sentences.add(resume_sentence)
         total_chapters = len(session['chapters'])
         total_sentences = sum(len(array) for array in session['chapters'])
         sentence_number = 0
+        pending_combines = []
         with tqdm(total=total_sentences, desc='convertsion 0.00%', bar_format='{desc}: {n_fmt}/{total_fmt} ', unit='step', initial=resume_sentence) as t:
             msg = f'A total of {total_chapters} blocks and {total_sentences} sentences...'
             for x in range(0, total_chapters):
+                # Fail fast: a block that could not be combined stops the conversion before more synthesis
+                for future in [future for future in pending_combines if future.done()]:
+                    if not future.result():
+                        return False
+                    pending_combines.remove(future)
                 chapter_num = x + 1
                 chapter_audio_file = f'chapter_{chapter_num}.{default_audio_proc_format}'
                 sentences = session['chapters'][x]
@@ -797,6 +901,12 @@ def convert_chapters_to_audio(session):
                     if progress_bar is not None:
                         progress_bar(sentence_number / total_sentences)
                     sentence_number += 1
+                # All sentence files of the block must be on disk before combining them
+                if not tts_manager.wait_pending_saves():
+                    return False
+                # Give cached blocks back once per block, not after every sentence
+                if session['device'] == 'cuda':
+                    torch.cuda.empty_cache()
                 if progress_bar is not None:
                     progress_bar(sentence_number / total_sentences)
                 end = sentence_number - 1 if sentence_number > 1 else sentence_number
@@ -806,28 +916,31 @@ def convert_chapters_to_audio(session):
                     if chapter_num <= resume_chapter:
                         msg = f'**Recovering missing file block {chapter_num}'
                         print(msg)
-                    if combine_audio_sentences(chapter_audio_file, start, end, session):
-                        msg = f'Combining block {chapter_num} to audio, sentence {start} to {end}'
-                        print(msg)
-                    else:
-                        msg = 'combine_audio_sentences() failed!'
-                        print(msg)
-                        return False
+                    # The block sentence files are all saved, ffmpeg can run while the next block is synthesized
+                    pending_combines.append(combine_executor.submit(combine_block, chapter_num, chapter_audio_file, start, end))
+        # Every block file must be written before the blocks are assembled
+        for future in pending_combines:
+            if not future.result():
+                return False
         return True
     except Exception as e:
         DependencyError(e)
         return False
+    finally:
+        # Cancel or early return: drop the combines not started yet, let a running ffmpeg finish
+        combine_executor.shutdown(wait=True, cancel_futures=True)
+        if tts_manager is not None:
+            tts_manager.close()
 
 def combine_audio_sentences(chapter_audio_file, start, end, session):
     try:
         chapter_audio_file = os.path.join(session['chapters_dir'], chapter_audio_file)
         file_list = os.path.join(session['chapters_dir_sentences'], 'sentences.txt')
-        sentence_files = [f for f in os.listdir(session['chapters_dir_sentences']) if f.endswith(f'.{default_audio_proc_format}')]
-        sentences_dir_ordered = sorted(sentence_files, key=lambda x: int(re.search(r'\d+', x).group()))
+        # Sentence files are named by their number, build the range instead of listing and sorting the whole dir
+        sentences_base = os.path.join(session['chapters_dir_sentences'], '')
         selected_files = [
-            os.path.join(session['chapters_dir_sentences'], f)
-            for f in sentences_dir_ordered
-            if start <= int(''.join(filter(str.isdigit, os.path.basename(f)))) <= end
+            file for file in (f'{sentences_base}{i}.{default_audio_proc_format}' for i in range(start, end + 1))
+            if os.path.exists(file)
         ]
         if not selected_files:
             error = 'No audio files found in the specified range.'
@@ -837,9 +950,11 @@ def combine_audio_sentences(chapter_audio_file, start, end, session):
             for file in selected_files:
                 file = file.replace("\\", "/")
                 f.write(f'file {file}\n')
+        # Stream copy is only safe for PCM wav, a copied flac keeps the first file's STREAMINFO (sample count, md5)
+        codec_args = ['-c', 'copy'] if default_audio_proc_format == 'wav' else ['-c:a', default_audio_proc_format]
         ffmpeg_cmd = [
-            shutil.which('ffmpeg'), '-y', '-safe', '0', '-f', 'concat', '-i', file_list,
-            '-c:a', default_audio_proc_format, '-map_metadata', '-1', chapter_audio_file
+            ffmpeg_bin, '-y', '-safe', '0', '-f', 'concat', '-i', file_list,
+            *codec_args, '-map_metadata', '-1', chapter_audio_file
         ]
         try:
             process = subprocess.Popen(
@@ -868,21 +983,31 @@ def combine_audio_sentences(chapter_audio_file, start, end, session):
         DependencyError(e)
         return False
 
+def get_audio_duration_ms(audio_file):
+    # A PCM wav header always matches its data chunk, no need to decode the whole block to get its length
+    if audio_file.endswith('.wav'):
+        import torchaudio
+        info = torchaudio.info(audio_file)
+        if info.num_frames > 0 and info.sample_rate > 0:
+            return round(1000 * info.num_frames / info.sample_rate)
+    # Compressed headers (flac STREAMINFO...) can be stale or missing, decode them as before
+    from pydub import AudioSegment
+    return len(AudioSegment.from_file(audio_file, format=default_audio_proc_format))
+
 def combine_audio_chapters(session):
     def assemble_segments():
         try:
             file_list = os.path.join(session['chapters_dir'], 'chapters.txt')
-            chapter_files_ordered = sorted(chapter_files, key=lambda x: int(re.search(r'\d+', x).group()))
-            if not chapter_files_ordered:
+            if not chapter_files:
                 error = 'No block files found.'
                 print(error)
                 return False
             with open(file_list, "w") as f:
-                for file in chapter_files_ordered:
+                for file in chapter_files:
                     file = file.replace("\\", "/")
                     f.write(f"file '{file}'\n")
             ffmpeg_cmd = [
-                shutil.which('ffmpeg'), '-y', '-safe', '0', '-f', 'concat', '-i', file_list,
+                ffmpeg_bin, '-y', '-safe', '0', '-f', 'concat', '-i', file_list,
                 '-c:a', default_audio_proc_format, '-map_metadata', '-1', combined_chapters_file
             ]
             try:
@@ -953,7 +1078,7 @@ def combine_audio_chapters(session):
                     msg = 'Cancel requested'
                     print(msg)
                     return False
-                duration_ms = len(AudioSegment.from_file(os.path.join(session['chapters_dir'],chapter_file), format=default_audio_proc_format))
+                duration_ms = get_audio_duration_ms(os.path.join(session['chapters_dir'], chapter_file))
                 ffmpeg_metadata += f'[CHAPTER]\nTIMEBASE=1/1000\nSTART={start_time}\n'
                 ffmpeg_metadata += f'END={start_time + duration_ms}\ntitle=Part {index + 1}\n'
                 start_time += duration_ms
@@ -976,7 +1101,7 @@ def combine_audio_chapters(session):
             ffmpeg_final_file = final_file
             if session['cover'] is not None:
                 ffmpeg_cover = session['cover']                    
-            ffmpeg_cmd = [shutil.which('ffmpeg'), '-i', ffmpeg_combined_audio, '-i', ffmpeg_metadata_file]
+            ffmpeg_cmd = [ffmpeg_bin, '-i', ffmpeg_combined_audio, '-i', ffmpeg_metadata_file]
             if session['output_format'] == 'wav':
                 ffmpeg_cmd += ['-map', '0:a']
             elif session['output_format'] ==  'aac':
@@ -1018,7 +1143,8 @@ def combine_audio_chapters(session):
                 if session['output_format'] != 'ogg':
                     ffmpeg_cmd += ['-af', 'loudnorm=I=-16:LRA=11:TP=-1.5,afftdn=nf=-70']
             ffmpeg_cmd += ['-strict', 'experimental', '-map_metadata', '1']
-            ffmpeg_cmd += ['-threads', '8', '-y', ffmpeg_final_file]
+            # 0 lets ffmpeg size its thread pool to the host instead of a fixed 8
+            ffmpeg_cmd += ['-threads', '0', '-y', ffmpeg_final_file]
             try:
                 process = subprocess.Popen(
                     ffmpeg_cmd,
@@ -1045,7 +1171,7 @@ def combine_audio_chapters(session):
             return False
     try:
         chapter_files = [f for f in os.listdir(session['chapters_dir']) if f.endswith(f'.{default_audio_proc_format}')]
-        chapter_files = sorted(chapter_files, key=lambda x: int(re.search(r'\d+', x).group()))
+        chapter_files = sorted(chapter_files, key=lambda x: int(digits_pattern.search(x).group()))
         if len(chapter_files) > 0:
             combined_chapters_file = os.path.join(session['process_dir'], get_sanitized(session['metadata']['title']) + '.' + default_audio_proc_format)
             metadata_file = os.path.join(session['process_dir'], 'metadata.txt')
@@ -1063,37 +1189,40 @@ def combine_audio_chapters(session):
         DependencyError(e)
         return False
 
-def replace_roman_numbers(text):
-    def roman_to_int(s):
-        try:
-            roman = {'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000,
-                     'IV': 4, 'IX': 9, 'XL': 40, 'XC': 90, 'CD': 400, 'CM': 900}   
-            i = 0
-            num = 0   
-            # Iterate over the string to calculate the integer value
-            while i < len(s):
-                # Check for two-character numerals (subtractive combinations)
-                if i + 1 < len(s) and s[i:i+2] in roman:
-                    num += roman[s[i:i+2]]
-                    i += 2
-                else:
-                    # Add the value of the single character
-                    num += roman[s[i]]
-                    i += 1   
-            return num
-        except Exception as e:
-            return s
-
-    roman_chapter_pattern = re.compile(
-        r'\b(chapter|volume|chapitre|tome|capitolo|capítulo|volumen|Kapitel|глава|том|κεφάλαιο|τόμος|capitul|poglavlje)\s'
-        r'(M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})|[IVXLCDM]+)\b',
-        re.IGNORECASE
-    )
-
-    roman_numerals_with_period = re.compile(
-        r'^(M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})|[IVXLCDM])\.+'
-    )
+roman_values = {
+    'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000,
+    'IV': 4, 'IX': 9, 'XL': 40, 'XC': 90, 'CD': 400, 'CM': 900
+}
+roman_chapter_pattern = re.compile(
+    r'\b(chapter|volume|chapitre|tome|capitolo|capítulo|volumen|Kapitel|глава|том|κεφάλαιο|τόμος|capitul|poglavlje)\s'
+    r'(M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})|[IVXLCDM]+)\b',
+    re.IGNORECASE
+)
+roman_numerals_with_period = re.compile(
+    r'^(M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})|[IVXLCDM])\.+'
+)
+
+@lru_cache(maxsize=1024)
+def roman_to_int(s):
+    # The same few numerals come back over and over in a book, cache them
+    try:
+        i = 0
+        num = 0   
+        # Iterate over the string to calculate the integer value
+        while i < len(s):
+            # Check for two-character numerals (subtractive combinations)
+            if i + 1 < len(s) and s[i:i+2] in roman_values:
+                num += roman_values[s[i:i+2]]
+                i += 2
+            else:
+                # Add the value of the single character
+                num += roman_values[s[i]]
+                i += 1   
+        return num
+    except Exception as e:
+        return s
 
+def replace_roman_numbers(text):
     def replace_chapter_match(match):
         chapter_word = match.group(1)
         roman_numeral = match.group(2)
@@ -1127,20 +1256,21 @@ def delete_unused_tmp_dirs(web_dir, days, session):
     for dir_path in dir_array:
         if not os.path.exists(dir_path) or not os.path.isdir(dir_path):
             continue  
-        for dir in os.listdir(dir_path):
-            if dir in current_user_dirs:
-                continue           
-            full_dir_path = os.path.join(dir_path, dir)  # Use a new variable
-            if not os.path.isdir(full_dir_path):
-                continue
-            try:
-                dir_mtime = os.path.getmtime(full_dir_path)
-                dir_ctime = os.path.getctime(full_dir_path)
-                if dir_mtime < threshold_time and dir_ctime < threshold_time:
-                    shutil.rmtree(full_dir_path, ignore_errors=True)
-                    print(f"Deleted expired session: {full_dir_path}")
-            except Exception as e:
-                print(f"Error deleting {full_dir_path}: {e}")
+        # scandir entries carry their type and a single cached stat
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.name in current_user_dirs:
+                    continue           
+                full_dir_path = entry.path
+                try:
+                    if not entry.is_dir():
+                        continue
+                    stat = entry.stat()
+                    if stat.st_mtime < threshold_time and stat.st_ctime < threshold_time:
+                        shutil.rmtree(full_dir_path, ignore_errors=True)
+                        print(f"Deleted expired session: {full_dir_path}")
+                except Exception as e:
+                    print(f"Error deleting {full_dir_path}: {e}")
 
 def compare_file_metadata(f1, f2):
     if os.path.getsize(f1) != os.path.getsize(f2):
@@ -1149,13 +1279,24 @@ def compare_file_metadata(f1, f2):
         return False
     return True
     
+@lru_cache(maxsize=None)
 def get_compatible_tts_engines(language):
-    compatible_engines = [
+    # models and language_tts are static. A tuple, every caller gets the same cached object
+    compatible_engines = tuple(
         tts for tts in models.keys()
         if language in language_tts.get(tts, {})
-    ]
+    )
     return compatible_engines
 
+@lru_cache(maxsize=None)
+def get_compatible_fine_tuned(tts_engine, language):
+    # A tuple, every caller gets the same cached object
+    compatible_fine_tuned = tuple(
+        name for name, details in models.get(tts_engine, {}).items()
+        if details.get('lang') == 'multi' or details.get('lang') == language
+    )
+    return compatible_fine_tuned
+
 def convert_ebook_batch(args):
     if isinstance(args['ebook_list'], list):
         ebook_list = args['ebook_list'][:]
@@ -1262,6 +1403,7 @@ def convert_ebook(args):
                     voice_name = get_sanitized(os.path.splitext(os.path.basename(session['voice']))[0])
                     final_voice_file = os.path.join(session['voice_dir'],f'{voice_name}_24000.wav')
                     if not os.path.exists(final_voice_file):
+                        from lib.classes.voice_extractor import VoiceExtractor
                         extractor = VoiceExtractor(session, models_dir, session['voice'], voice_name)
                         status, msg = extractor.extract_voice()
                         if status:
@@ -1324,15 +1466,15 @@ def convert_ebook(args):
                             metadata['language'] = session['language']
                             metadata['title'] = os.path.splitext(os.path.basename(session['ebook']))[0].replace('_',' ') if not metadata['title'] else metadata['title']
                             metadata['creator'] =  False if not metadata['creator'] or metadata['creator'] == 'Unknown' else metadata['creator']
-                            session['metadata'] = metadata
-                            
                             try:
-                                if len(session['metadata']['language']) == 2:
+                                if len(metadata['language']) == 2:
                                     lang_array = languages.get(part1=session['language'])
                                     if lang_array:
-                                        session['metadata']['language'] = lang_array.part3     
+                                        metadata['language'] = lang_array.part3     
                             except Exception as e:
                                 pass
+                            # Assigned once complete so the session revision sees the change
+                            session['metadata'] = metadata
                            
                             if session['metadata']['language'] != session['language']:
                                 error = f"WARNING!!! language selected {session['language']} differs from the EPUB file language {session['metadata']['language']}"
@@ -1344,10 +1486,11 @@ def convert_ebook(args):
                                     if convert_chapters_to_audio(session):
                                         final_file = combine_audio_chapters(session)               
                                         if final_file is not None:
-                                            chapters_dirs = [
-                                                dir_name for dir_name in os.listdir(session['process_dir'])
-                                                if fnmatch.fnmatch(dir_name, "chapters_*") and os.path.isdir(os.path.join(session['process_dir'], dir_name))
-                                            ]
+                                            with os.scandir(session['process_dir']) as entries:
+                                                chapters_dirs = [
+                                                    entry.name for entry in entries
+                                                    if fnmatch.fnmatch(entry.name, "chapters_*") and entry.is_dir()
+                                                ]
                                             if is_gui_process:
                                                 if len(chapters_dirs) > 1:
                                                     if os.path.exists(session['chapters_dir']):
@@ -1399,12 +1542,17 @@ def convert_ebook(args):
 
 def restore_session_from_data(data, session):
     try:
-        for key, value in data.items():
-            if key in session:  # Check if the key exists in session
-                if isinstance(value, dict) and isinstance(session[key], dict):
-                    restore_session_from_data(value, session[key])
-                else:
-                    session[key] = value
+        stack = [(data, session)]
+        while stack:
+            src, dst = stack.pop()
+            for key, value in src.items():
+                if key in dst:  # Check if the key exists in session
+                    if isinstance(value, dict) and isinstance(dst[key], dict):
+                        stack.append((value, dst[key]))
+                    else:
+                        dst[key] = value
+        # Nested dicts are written in place, which bypasses the session's __setitem__
+        session.touch()
     except Exception as e:
         alert_exception(e)
 
@@ -1444,33 +1592,182 @@ def reset_ebook_session(id):
     }
     restore_session_from_data(data, session)
 
+def walk_voice_files(root_dir, voice_suffix='_24000.wav'):
+    # scandir walk with an explicit stack, file type comes from the dir entry, no extra stat
+    voices = []
+    stack = [root_dir]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(voice_suffix) and entry.is_file():
+                        voices.append((os.path.splitext(entry.name[:-len(voice_suffix)])[0], entry.path))
+        except FileNotFoundError:
+            continue
+    return voices
+
+@lru_cache(maxsize=None)
+def get_builtin_voices(voice_lang_dir):
+    # Shipped voices do not change while the app runs, walk each language tree only once
+    return walk_voice_files(os.path.join(voices_dir, voice_lang_dir))
+
+voice_scan_cache = OrderedDict()  # Least recently used first
+dir_scan_cache = OrderedDict()  # Least recently used first
+scan_cache_lock = threading.Lock()
+
+def get_session_voices(voice_dir):
+    # Uploaded samples are written to and deleted from the voice_dir root, so its mtime tracks the listing
+    try:
+        mtime_ns = os.stat(voice_dir).st_mtime_ns
+    except FileNotFoundError:
+        return ()
+    with scan_cache_lock:
+        cached = voice_scan_cache.get(voice_dir)
+        if cached is not None and cached[0] == mtime_ns:
+            voice_scan_cache.move_to_end(voice_dir)
+            return cached[1]
+    voices = tuple(walk_voice_files(voice_dir))
+    with scan_cache_lock:
+        voice_scan_cache[voice_dir] = (mtime_ns, voices)
+        voice_scan_cache.move_to_end(voice_dir)
+        # One voice_dir per session, keep no more of them than sessions kept in memory
+        while len(voice_scan_cache) > interface_max_sessions:
+            voice_scan_cache.popitem(last=False)
+    return voices
+
+def scan_dir(dir_path):
+    # Entries are cached per directory until its mtime changes (entry added, removed or renamed)
+    mtime_ns = os.stat(dir_path).st_mtime_ns
+    with scan_cache_lock:
+        cached = dir_scan_cache.get(dir_path)
+        if cached is not None and cached[0] == mtime_ns:
+            dir_scan_cache.move_to_end(dir_path)
+            return cached[1]
+    with os.scandir(dir_path) as entries:
+        dir_entries = tuple((entry.name, entry.path, entry.is_dir()) for entry in entries)
+    with scan_cache_lock:
+        dir_scan_cache[dir_path] = (mtime_ns, dir_entries)
+        dir_scan_cache.move_to_end(dir_path)
+        # Keys are per session dirs, keep no more of them than sessions kept in memory
+        while len(dir_scan_cache) > interface_max_sessions:
+            dir_scan_cache.popitem(last=False)
+    return dir_entries
+
 def get_all_ip_addresses():
-    ip_addresses = []
-    for interface, addresses in psutil.net_if_addrs().items():
-        for address in addresses:
-            if address.family == socket.AF_INET:
-                ip_addresses.append(address.address)
-            elif address.family == socket.AF_INET6:
-                ip_addresses.append(address.address)  
+    families = (socket.AF_INET, socket.AF_INET6)
+    ip_addresses = [
+        address.address
+        for addresses in psutil.net_if_addrs().values()
+        for address in addresses if address.family in families
+    ]
     return ip_addresses
 
+# language_mapping is static, build the dropdown choices once
+language_options = [
+    (
+        f"{details['name']} - {details['native_name']}" if details['name'] != details['native_name'] else details['name'],
+        lang
+    )
+    for lang, details in language_mapping.items()
+]
+
+modal_style = '''
+            <style>
+                .modal {
+                    display: none; /* Hidden by default */
+                    position: fixed;
+                    top: 0;
+                    left: 0;
+                    width: 100%;
+                    height: 100%;
+                    background-color: rgba(0, 0, 0, 0.5);
+                    z-index: 9999;
+                    display: flex;
+                    justify-content: center;
+                    align-items: center;
+                }
+                .modal-content {
+                    background-color: #333;
+                    padding: 20px;
+                    border-radius: 8px;
+                    text-align: center;
+                    max-width: 300px;
+                    box-shadow: 0 4px 8px rgba(0, 0, 0, 0.5);
+                    border: 2px solid #FFA500;
+                    color: white;
+                    font-family: Arial, sans-serif;
+                    position: relative;
+                }
+                .modal-content p {
+                    margin: 10px 0;
+                }
+                .confirm-buttons {
+                    display: flex;
+                    justify-content: space-evenly;
+                    margin-top: 20px;
+                }
+                .confirm-buttons button {
+                    padding: 10px 20px;
+                    border: none;
+                    border-radius: 5px;
+                    font-size: 16px;
+                    cursor: pointer;
+                    font-weight: bold;
+                }
+                .confirm-buttons .confirm_yes_btn {
+                    background-color: #28a745;
+                    color: white;
+                }
+                .confirm-buttons .confirm_no_btn {
+                    background-color: #dc3545;
+                    color: white;
+                }
+                .confirm-buttons .confirm_yes_btn:hover {
+                    background-color: #34d058;
+                }
+                .confirm-buttons .confirm_no_btn:hover {
+                    background-color: #ff6f71;
+                }
+                /* Spinner */
+                .spinner {
+                    margin: 15px auto;
+                    border: 4px solid rgba(255, 255, 255, 0.2);
+                    border-top: 4px solid #FFA500;
+                    border-radius: 50%;
+                    width: 30px;
+                    height: 30px;
+                    animation: spin 1s linear infinite;
+                }
+                @keyframes spin {
+                    0% { transform: rotate(0deg); }
+                    100% { transform: rotate(360deg); }
+                }
+            </style>
+'''
+
+modal_confirm_buttons = '''
+            <div class="confirm-buttons">
+                <button class="confirm_yes_btn" onclick="document.querySelector('#confirm_yes_btn_hidden').click()">✔</button>
+                <button class="confirm_no_btn" onclick="document.querySelector('#confirm_no_btn_hidden').click()">⨉</button>
+            </div>
+'''
+
 def web_interface(args):
     script_mode = args['script_mode']
     is_gui_process = args['is_gui_process']
     is_gui_shared = args['share']
     ebook_src = None
-    language_options = [
-        (
-            f"{details['name']} - {details['native_name']}" if details['name'] != details['native_name'] else details['name'],
-            lang
-        )
-        for lang, details in language_mapping.items()
-    ]
     voice_options = []
+    voice_values = set()
     tts_engine_options = []
     custom_model_options = []
+    custom_model_values = set()
     fine_tuned_options = []
     audiobook_options = []
+    tmp_cleanup_executor = ThreadPoolExecutor(max_workers=1)
+    tmp_cleanup_times = {}
     
     src_label_file = 'Select a File'
     src_label_dir = 'Select a Directory'
@@ -1493,16 +1790,6 @@ def web_interface(args):
         radius_size='lg',
         font_mono=['JetBrains Mono', 'monospace', 'Consolas', 'Menlo', 'Liberation Mono']
     )
-    """
-    def process_cleanup(state):
-        try:
-            print('***************PROCESS CLEANING REQUESTED*****************')
-            if state['id'] in context.sessions:
-                del context.sessions[state['id']]
-        except Exception as e:
-            error = f'process_cleanup(): {e}'
-            alert_exception(error)
-    """
     with gr.Blocks(theme=theme, delete_cache=(86400, 86400)) as interface:
         main_html = gr.HTML(
             '''
@@ -1624,23 +1911,6 @@ def web_interface(args):
                     display: none !important;
                 }
             </style>
-            <script>
-            setInterval(() => {
-                const data = window.localStorage.getItem('data');
-                if(data){
-                    const obj = JSON.parse(data);
-                    if(typeof(obj.id) != 'undefined'){
-                        if(obj.id != null && obj.id != ""){
-                            fetch('/api/heartbeat', {
-                                method: 'POST',
-                                headers: { 'Content-Type': 'application/json' },
-                                body: JSON.stringify({ 'id': obj.id })
-                            });
-                        }
-                    }
-                }
-            }, 5000);
-            </script>
             '''
         )
         main_markdown = gr.Markdown(
@@ -1762,7 +2032,7 @@ def web_interface(args):
                     visible=False
                 )
     
-        gr_state = gr.State(value={"hash": None})
+        gr_state = gr.State(value={"hash": None, "id": None}, delete_callback=context.release_tab)
         gr_state_alert = gr.State(value={"type": None,"msg": None})
         gr_read_data = gr.JSON(visible=False)
         gr_write_data = gr.JSON(visible=False)
@@ -1794,93 +2064,23 @@ def web_interface(args):
                         gr.Success(state['msg'])
 
         def show_modal(type, msg):
-            return f'''
-            <style>
-                .modal {{
-                    display: none; /* Hidden by default */
-                    position: fixed;
-                    top: 0;
-                    left: 0;
-                    width: 100%;
-                    height: 100%;
-                    background-color: rgba(0, 0, 0, 0.5);
-                    z-index: 9999;
-                    display: flex;
-                    justify-content: center;
-                    align-items: center;
-                }}
-                .modal-content {{
-                    background-color: #333;
-                    padding: 20px;
-                    border-radius: 8px;
-                    text-align: center;
-                    max-width: 300px;
-                    box-shadow: 0 4px 8px rgba(0, 0, 0, 0.5);
-                    border: 2px solid #FFA500;
-                    color: white;
-                    font-family: Arial, sans-serif;
-                    position: relative;
-                }}
-                .modal-content p {{
-                    margin: 10px 0;
-                }}
-                .confirm-buttons {{
-                    display: flex;
-                    justify-content: space-evenly;
-                    margin-top: 20px;
-                }}
-                .confirm-buttons button {{
-                    padding: 10px 20px;
-                    border: none;
-                    border-radius: 5px;
-                    font-size: 16px;
-                    cursor: pointer;
-                    font-weight: bold;
-                }}
-                .confirm-buttons .confirm_yes_btn {{
-                    background-color: #28a745;
-                    color: white;
-                }}
-                .confirm-buttons .confirm_no_btn {{
-                    background-color: #dc3545;
-                    color: white;
-                }}
-                .confirm-buttons .confirm_yes_btn:hover {{
-                    background-color: #34d058;
-                }}
-                .confirm-buttons .confirm_no_btn:hover {{
-                    background-color: #ff6f71;
-                }}
-                /* Spinner */
-                .spinner {{
-                    margin: 15px auto;
-                    border: 4px solid rgba(255, 255, 255, 0.2);
-                    border-top: 4px solid #FFA500;
-                    border-radius: 50%;
-                    width: 30px;
-                    height: 30px;
-                    animation: spin 1s linear infinite;
-                }}
-                @keyframes spin {{
-                    0% {{ transform: rotate(0deg); }}
-                    100% {{ transform: rotate(360deg); }}
-                }}
-            </style>
-            <div id="custom-modal" class="modal">
-                <div class="modal-content">
-                    <p style="color:#ffffff">{msg}</p>            
-                    {show_confirm() if type == 'confirm' else '<div class="spinner"></div>'}
-                </div>
-            </div>
-            '''
-          
-        def show_confirm():
-            return '''
-            <div class="confirm-buttons">
-                <button class="confirm_yes_btn" onclick="document.querySelector('#confirm_yes_btn_hidden').click()">✔</button>
-                <button class="confirm_no_btn" onclick="document.querySelector('#confirm_no_btn_hidden').click()">⨉</button>
-            </div>
-            '''
+            # Only msg varies, it may carry uploaded file names so it is escaped
+            return (
+                modal_style
+                + '<div id="custom-modal" class="modal"><div class="modal-content">'
+                + f'<p style="color:#ffffff">{html.escape(msg)}</p>'
+                + (modal_confirm_buttons if type == 'confirm' else '<div class="spinner"></div>')
+                + '</div></div>'
+            )
+
+        def schedule_tmp_cleanup(web_dir, days, session):
+            # Expiry is counted in days, one background sweep per hour keeps the walk off the page load
+            now = time.monotonic()
+            last_run = tmp_cleanup_times.get(web_dir)
+            if last_run is not None and now - last_run < 3600:
+                return
+            tmp_cleanup_times[web_dir] = now
+            tmp_cleanup_executor.submit(delete_unused_tmp_dirs, web_dir, days, session)
 
         def alert_exception(error):
             gr.Error(error)
@@ -1985,6 +2185,7 @@ def web_interface(args):
                     voice_name = os.path.splitext(os.path.basename(f))[0].replace('&', 'And')
                     voice_name = get_sanitized(voice_name)
                     final_voice_file = os.path.join(session['voice_dir'],f'{voice_name}_24000.wav')
+                    from lib.classes.voice_extractor import VoiceExtractor
                     extractor = VoiceExtractor(session, models_dir, f, voice_name)
                     status, msg = extractor.extract_voice()
                     if status:
@@ -2002,7 +2203,7 @@ def web_interface(args):
 
         def change_gr_voice_list(selected, id):
             session = context.get_session(id)
-            session['voice'] = next((value for label, value in voice_options if value == selected), None)
+            session['voice'] = selected if selected in voice_values else None
             visible = True if session['voice'] is not None else False
             min_width = 60 if session['voice'] is not None else 0
             return gr.update(value=session['voice'], visible=visible, min_width=min_width), gr.update(visible=visible)
@@ -2010,7 +2211,7 @@ def web_interface(args):
         def click_gr_voice_del_btn(selected, id):          
             try:
                 if selected is not None:
-                    voice_name = re.sub(r'_(24000|16000)\.wav$', '', os.path.basename(selected))
+                    voice_name = voice_rate_pattern.sub('', os.path.basename(selected))
                     if voice_name in default_xtts_settings['voices'].keys() or voice_name in default_yourtts_settings['voices'].keys():
                         error = f'Voice file {voice_name} is a builtin voice and cannot be deleted.'
                         show_alert({"type": "warning", "msg": error})
@@ -2062,11 +2263,11 @@ def web_interface(args):
                     session = context.get_session(id)
                     if method == 'confirm_voice_del':
                         selected_name = os.path.basename(voice)
-                        pattern = re.sub(r'_(24000|16000)\.wav$', '_*.wav', voice)
+                        pattern = voice_rate_pattern.sub('_*.wav', voice)
                         files_to_remove = glob(pattern)
                         for file in files_to_remove:
                             os.remove(file)                           
-                        msg = f'Voice file {re.sub(r'_(24000|16000)\.wav$', '', selected_name)} deleted!'
+                        msg = f'Voice file {voice_rate_pattern.sub('', selected_name)} deleted!'
                         session['voice'] = None
                         show_alert({"type": "warning", "msg": msg})
                         return update_gr_voice_list(id), gr.update(), gr.update(), gr.update(visible=False)
@@ -2099,20 +2300,13 @@ def web_interface(args):
 
         def update_gr_voice_list(id):
             try:
-                nonlocal voice_options
+                nonlocal voice_options, voice_values
                 session = context.get_session(id)
                 voice_lang_dir = session['language'] if session['language'] != 'con' else 'con-'  # Bypass Windows CON reserved name
-                voice_file_pattern = "*_24000.wav"
-                voice_options = [
-                    (os.path.splitext(re.sub(r'_24000\.wav$', '', f.name))[0], str(f))
-                    for f in Path(session['voice_dir']).rglob(voice_file_pattern)
-                ]
-                voice_options += [
-                    (os.path.splitext(re.sub(r'_24000\.wav$', '', f.name))[0], str(f))
-                    for f in Path(os.path.join(voices_dir, voice_lang_dir)).rglob(voice_file_pattern)
-                ]
+                voice_options = [*get_session_voices(session['voice_dir']), *get_builtin_voices(voice_lang_dir)]
                 voice_options = [('None', None)] + sorted(voice_options, key=lambda x: x[0].lower())
-                session['voice'] = session['voice'] if session['voice'] in [option[1] for option in voice_options] else voice_options[0][1]
+                voice_values = {value for label, value in voice_options}
+                session['voice'] = session['voice'] if session['voice'] in voice_values else voice_options[0][1]
                 return gr.update(choices=voice_options, value=session['voice'])
             except Exception as e:
                 error = f'update_gr_voice_list(): {e}!'
@@ -2133,15 +2327,14 @@ def web_interface(args):
 
         def update_gr_custom_model_list(id):
             try:
-                nonlocal custom_model_options
+                nonlocal custom_model_options, custom_model_values
                 session = context.get_session(id)
                 custom_model_tts_dir = check_custom_model_tts(session['custom_model_dir'], session['tts_engine'])
                 custom_model_options = [('None', None)] + [
-                    (os.path.basename(os.path.join(custom_model_tts_dir, dir)), os.path.join(custom_model_tts_dir, dir))
-                    for dir in os.listdir(custom_model_tts_dir)
-                    if os.path.isdir(os.path.join(custom_model_tts_dir, dir))
+                    (name, path) for name, path, is_dir in scan_dir(custom_model_tts_dir) if is_dir
                 ]
-                session['custom_model'] = session['custom_model'] if session['custom_model'] in [option[1] for option in custom_model_options] else custom_model_options[0][1]
+                custom_model_values = {value for label, value in custom_model_options}
+                session['custom_model'] = session['custom_model'] if session['custom_model'] in custom_model_values else custom_model_options[0][1]
                 return gr.update(choices=custom_model_options, value=session['custom_model'])
             except Exception as e:
                 error = f'update_gr_custom_model_list(): {e}!'
@@ -2152,10 +2345,7 @@ def web_interface(args):
             try:
                 nonlocal fine_tuned_options
                 session = context.get_session(id)
-                fine_tuned_options = [
-                    name for name, details in models.get(session['tts_engine'],{}).items()
-                    if details.get('lang') == 'multi' or details.get('lang') == session['language']
-                ]
+                fine_tuned_options = get_compatible_fine_tuned(session['tts_engine'], session['language'])
                 session['fine_tuned'] = session['fine_tuned'] if session['fine_tuned'] in fine_tuned_options else default_fine_tuned
                 return gr.update(choices=fine_tuned_options, value=session['fine_tuned'])
             except Exception as e:
@@ -2249,7 +2439,7 @@ def web_interface(args):
 
         def change_gr_custom_model_list(selected, id):
             session = context.get_session(id)
-            session['custom_model'] = next((value for label, value in custom_model_options if value == selected), None)
+            session['custom_model'] = selected if selected in custom_model_values else None
             visible = True if session['custom_model'] is not None else False
             return gr.update(visible=not visible), gr.update(visible=visible)
         
@@ -2367,15 +2557,12 @@ def web_interface(args):
             try:
                 nonlocal audiobook_options
                 session = context.get_session(id)
-                audiobook_options = [
-                    (f, os.path.join(session['audiobooks_dir'], str(f)))
-                    for f in os.listdir(session['audiobooks_dir'])
-                ]
-                audiobook_options.sort(
-                    key=lambda x: os.path.getmtime(x[1]),
-                    reverse=True
-                )
-                session['audiobook'] = session['audiobook'] if session['audiobook'] in [option[1] for option in audiobook_options] else None
+                # File mtimes are read from the same scandir pass, newest first
+                with os.scandir(session['audiobooks_dir']) as entries:
+                    audiobook_entries = [(entry.name, entry.path, entry.stat().st_mtime_ns) for entry in entries]
+                audiobook_entries.sort(key=itemgetter(2), reverse=True)
+                audiobook_options = [(name, path) for name, path, mtime_ns in audiobook_entries]
+                session['audiobook'] = session['audiobook'] if session['audiobook'] in {path for name, path in audiobook_options} else None
                 if len(audiobook_options) > 0:
                     if session['audiobook'] is not None:
                         return gr.update(choices=audiobook_options, value=session['audiobook'])
@@ -2428,20 +2615,28 @@ def web_interface(args):
                 session['system'] = (f"{platform.system()}-{platform.release()}").lower()
                 session['custom_model_dir'] = os.path.join(models_dir, '__sessions', f"model-{session['id']}")
                 session['voice_dir'] = os.path.join(voices_dir, '__sessions', f"voice-{session['id']}")
-                os.makedirs(session['custom_model_dir'], exist_ok=True)
-                os.makedirs(session['voice_dir'], exist_ok=True)             
+                # An existing dir costs one stat this way instead of a failed mkdir plus a stat
+                for session_dir in (session['custom_model_dir'], session['voice_dir']):
+                    if not os.path.isdir(session_dir):
+                        os.makedirs(session_dir, exist_ok=True)
                 if is_gui_shared:
                     msg = f' Note: access limit time: {interface_shared_tmp_expire} days'
                     session['audiobooks_dir'] = os.path.join(audiobooks_gradio_dir, f"web-{session['id']}")
-                    delete_unused_tmp_dirs(audiobooks_gradio_dir, interface_shared_tmp_expire, session)
+                    schedule_tmp_cleanup(audiobooks_gradio_dir, interface_shared_tmp_expire, session)
                 else:
                     msg = f' Note: if no activity is detected after {tmp_expire} days, your session will be cleaned up.'
                     session['audiobooks_dir'] = os.path.join(audiobooks_host_dir, f"web-{session['id']}")
-                    delete_unused_tmp_dirs(audiobooks_host_dir, tmp_expire, session)
+                    schedule_tmp_cleanup(audiobooks_host_dir, tmp_expire, session)
                 if not os.path.exists(session['audiobooks_dir']):
                     os.makedirs(session['audiobooks_dir'], exist_ok=True)
+                if state.get('id') != session['id']:
+                    # The tab moved to another session, its count on the previous one must go or that session is never released
+                    if state.get('id') is not None:
+                        context.release_tab(state)
+                    context.bind_tab(session['id'])
+                    state['id'] = session['id']
                 previous_hash = state['hash']
-                new_hash = hash_proxy_dict(MappingProxyType(session))
+                new_hash = hash_proxy_dict(session)
                 state['hash'] = new_hash
                 session_dict = proxy_to_dict(session)
                 show_alert({"type": "info", "msg": msg})
@@ -2460,8 +2655,12 @@ def web_interface(args):
                             if session['event'] == 'clear':
                                 session_dict = session
                             else:
+                                # No write since the last tick, nothing to hash
+                                if state.get('revision') == session.revision:
+                                    return gr.update(), gr.update(), gr.update()
+                                state['revision'] = session.revision
                                 previous_hash = state['hash']
-                                new_hash = hash_proxy_dict(MappingProxyType(session))
+                                new_hash = hash_proxy_dict(session)
                                 if previous_hash == new_hash:
                                     return gr.update(), gr.update(), gr.update()
                                 else:
@@ -2470,8 +2669,8 @@ def web_interface(args):
                             if session['status'] == 'converting':
                                 if session['progress'] != len(audiobook_options):
                                     session['progress'] = len(audiobook_options)
-                                    return gr.update(value=json.dumps(session_dict, indent=4)), gr.update(value=state), update_gr_audiobook_list(id)
-                            return gr.update(value=json.dumps(session_dict, indent=4)), gr.update(value=state), gr.update()
+                                    return gr.update(value=orjson.dumps(session_dict, option=orjson.OPT_NON_STR_KEYS).decode()), gr.update(value=state), update_gr_audiobook_list(id)
+                            return gr.update(value=orjson.dumps(session_dict, option=orjson.OPT_NON_STR_KEYS).decode()), gr.update(value=state), gr.update()
                 return gr.update(), gr.update(), gr.update()
             except Exception as e:
                 error = f'save_session(): {e}!'
@@ -2577,43 +2776,26 @@ def web_interface(args):
             outputs=[gr_confirm_field_hidden, gr_modal]
         )
         ########## Parameters
-        gr_temperature.change(
-            fn=lambda val, id: change_param('temperature', val, id),
-            inputs=[gr_temperature, gr_session],
-            outputs=None
-        )
-        gr_length_penalty.change(
-            fn=lambda val, id, val2: change_param('length_penalty', val, id, val2),
-            inputs=[gr_length_penalty, gr_session, gr_num_beams],
-            outputs=None,
-        )
-        gr_num_beams.change(
-            fn=lambda val, id, val2: change_param('num_beams', val, id, val2),
-            inputs=[gr_num_beams, gr_session, gr_length_penalty],
-            outputs=None,
-        )
-        gr_repetition_penalty.change(
-            fn=lambda val, id: change_param('repetition_penalty', val, id),
-            inputs=[gr_repetition_penalty, gr_session],
-            outputs=None
-        )
-        gr_top_k.change(
-            fn=lambda val, id: change_param('top_k', val, id),
-            inputs=[gr_top_k, gr_session],
-            outputs=None
-        )
-        gr_top_p.change(
-            fn=lambda val, id: change_param('top_p', val, id),
-            inputs=[gr_top_p, gr_session],
-            outputs=None
-        )
-        gr_speed.change(
-            fn=lambda val, id: change_param('speed', val, id),
-            inputs=[gr_speed, gr_session],
-            outputs=None
-        )
+        for key, component in (
+            ('temperature', gr_temperature), ('repetition_penalty', gr_repetition_penalty),
+            ('top_k', gr_top_k), ('top_p', gr_top_p), ('speed', gr_speed)
+        ):
+            component.change(
+                fn=partial(change_param, key),
+                inputs=[component, gr_session],
+                outputs=None
+            )
+        # Both are checked against each other
+        for key, component, other in (
+            ('length_penalty', gr_length_penalty, gr_num_beams), ('num_beams', gr_num_beams, gr_length_penalty)
+        ):
+            component.change(
+                fn=partial(change_param, key),
+                inputs=[component, gr_session, other],
+                outputs=None
+            )
         gr_enable_text_splitting.change(
-            fn=lambda val, id: change_param('enable_text_splitting', val, id),
+            fn=partial(change_param, 'enable_text_splitting'),
             inputs=[gr_enable_text_splitting, gr_session],
             outputs=None
         )
@@ -2652,10 +2834,38 @@ def web_interface(args):
             js='''
                 (data)=>{
                     if(data){
-                        localStorage.clear();
-                        if(data['event'] != 'clear'){
-                            console.log('save: ', data);
-                            window.localStorage.setItem("data", JSON.stringify(data));
+                        const flush = () => {
+                            const pending = window.pendingSessionData;
+                            if(!pending){
+                                return;
+                            }
+                            window.pendingSessionData = null;
+                            localStorage.clear();
+                            if(pending['event'] != 'clear'){
+                                console.log('save: ', pending);
+                                window.localStorage.setItem("data", JSON.stringify(pending));
+                            }
+                        };
+                        if(!window.sessionFlushBound){
+                            // A write still waiting for idle time is flushed before the page goes away
+                            window.sessionFlushBound = true;
+                            window.addEventListener('pagehide', flush);
+                            document.addEventListener('visibilitychange', () => {
+                                if(document.visibilityState === 'hidden'){
+                                    flush();
+                                }
+                            });
+                        }
+                        // Only the latest session needs writing, a flush is already queued if one is pending
+                        const queued = window.pendingSessionData != null;
+                        window.pendingSessionData = data;
+                        if(!queued){
+                            // stringify + setItem are synchronous, run them when the page is idle, at most 1s later
+                            if(window.requestIdleCallback){
+                                window.requestIdleCallback(flush, {timeout: 1000});
+                            }else{
+                                setTimeout(flush, 0);
+                            }
                         }
                     }
                 }
@@ -0,0 +1,33 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+pytest.importorskip('torchaudio')
+pytest.importorskip('pydub')
+functions = pytest.importorskip('lib.functions')
+
+if shutil.which('ffmpeg') is None:
+    pytest.skip('ffmpeg is required', allow_module_level=True)
+
+def make_sentence(path, seconds, sample_rate=24000):
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi',
+        '-i', f'sine=frequency=440:sample_rate={sample_rate}:duration={seconds}',
+        '-ac', '1', '-c:a', 'flac', path
+    ], check=True)
+
+def test_combined_flac_block_duration(tmp_path):
+    sentences_dir = tmp_path / 'sentences'
+    sentences_dir.mkdir()
+    make_sentence(str(sentences_dir / '0.flac'), 1)
+    make_sentence(str(sentences_dir / '1.flac'), 2)
+    session = {
+        'chapters_dir': str(tmp_path),
+        'chapters_dir_sentences': str(sentences_dir)
+    }
+    assert functions.combine_audio_sentences('chapter_1.flac', 0, 1, session)
+    block_file = os.path.join(str(tmp_path), 'chapter_1.flac')
+    # Must be the whole block, not the first sentence length left in a copied STREAMINFO
+    assert abs(functions.get_audio_duration_ms(block_file) - 3000) <= 50
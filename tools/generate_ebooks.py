@@ -40,15 +40,19 @@ for lang_code, lang_info in tqdm(language_mapping.items(), desc="Processing lang
             lang_iso = language_array.part1
             if lang_iso == "zh":
                 lang_iso = "zh-CN"
-        # Translate the text
-        translated_text = GoogleTranslator(source='en', target=lang_iso).translate(base_text)
-        print(f"\nTranslated text for {lang_info['name']} ({lang_iso}): {translated_text}")
-
-        # Write the translated text to a txt file
         txt_filename = f"test_{lang_code}.txt"
         txt_filepath = os.path.join(output_dir, txt_filename)
-        with open(txt_filepath, 'w', encoding='utf-8') as f:
-            f.write(translated_text)
+        # The base text never changes, reuse the translation from a previous run instead of calling the web service again
+        if os.path.exists(txt_filepath):
+            with open(txt_filepath, 'r', encoding='utf-8') as f:
+                translated_text = f.read()
+        else:
+            # Translate the text
+            translated_text = GoogleTranslator(source='en', target=lang_iso).translate(base_text)
+            # Write the translated text to a txt file
+            with open(txt_filepath, 'w', encoding='utf-8') as f:
+                f.write(translated_text)
+        print(f"\nTranslated text for {lang_info['name']} ({lang_iso}): {translated_text}")
 
         # Prepare the ebook-convert command
         azw3_filename = f"test_{lang_code}.azw3"